@@ -1,6 +1,5 @@
 # for data managaement
-import numpy as np
-import pandas as pd
+# (pandas is only loaded if figures have to be built from the data)
 import time
 from datetime import datetime, timedelta
 
@@ -18,13 +17,16 @@ import dash
 import dash_core_components as dcc
 import dash_html_components as html
 import dash_bootstrap_components as dbc
+from dash.dependencies import Input, Output, State
+import flask
 
 # for scraping data
 import bs4
 import requests
 
 
-from figures import  fig2, fig3, fig4, headline, fig5, fig6
+# figures are built on first request (or by the warm-up thread) and cached
+import registry
 
 
 app = dash.Dash(__name__, external_stylesheets=[dbc.themes.BOOTSTRAP], meta_tags=[
@@ -33,7 +35,7 @@ application = app.server
 app.title = 'COVID-19 Cases & Deaths Dashboard'
 
 
-app.layout = html.Div(
+layout = html.Div(
     html.Div([
         html.Div([
             html.Div([
@@ -71,7 +73,7 @@ app.layout = html.Div(
         html.Div([
             html.Div([
                 dcc.Graph(
-                    figure=headline,
+                    id='headline-chart',
                     responsive=False,
 
                 )
@@ -88,10 +90,19 @@ app.layout = html.Div(
 
             html.Div([
                 dcc.Graph(
-                    figure=fig6,
+                    id='density-chart',
                     responsive=False,
 
-                )
+                ),
+                html.Label('Week:'),
+                dcc.Slider(
+                    id='density-week',
+                    min=9,
+                    max=53,
+                    step=1,
+                    value=45,
+                    marks={w: str(w) for w in range(10, 54, 5)},
+                ),
             ],
                 className="five columns",
                 style={
@@ -109,7 +120,7 @@ app.layout = html.Div(
         html.Div([
             html.Div([
                 dcc.Graph(
-                    figure=fig5,
+                    id='excess-chart',
                     responsive=False,
                 )
             ],
@@ -122,9 +133,17 @@ app.layout = html.Div(
 
             html.Div([
                 dcc.Graph(
-                    figure=fig2,
+                    id='deaths-chart',
                     responsive=False,
-                )
+                ),
+                html.Label('Days since weekly deaths reached:'),
+                dcc.Input(
+                    id='deaths-threshold',
+                    type='number',
+                    min=0,
+                    value=10,
+                    debounce=True,
+                ),
             ],
                 className="five columns",
                 style={
@@ -141,10 +160,18 @@ app.layout = html.Div(
         html.Div([
             html.Div([
                 dcc.Graph(
-                    figure=fig3,
+                    id='cases-chart',
                     responsive=False,
 
-                )
+                ),
+                html.Label('Days since weekly cases reached:'),
+                dcc.Input(
+                    id='cases-threshold',
+                    type='number',
+                    min=0,
+                    value=100,
+                    debounce=True,
+                ),
             ],
                 className="five columns",
                 style={
@@ -155,7 +182,7 @@ app.layout = html.Div(
 
             html.Div([
                 dcc.Graph(
-                    figure=fig4,
+                    id='bubble-chart',
                     responsive=False,
 
                 )
@@ -245,6 +272,77 @@ app.layout = html.Div(
     )
 )
 
+
+def serve_layout():
+    ''' the layout is made for each page load, recording the version of the
+        data being served so every chart on the page comes from it '''
+    return html.Div([
+        dcc.Store(id='snapshot-version', data=registry.current_version()),
+        layout])
+
+
+app.layout = serve_layout
+
+# fill in the charts from the figure registry when the page loads
+def serve_figure(name):
+    ''' makes a callback that returns a figure from the registry '''
+    def callback(version):
+        return registry.get_figure(name, version)
+    return callback
+
+
+for name, id_ in [('headline', 'headline-chart'),
+                  ('fig4', 'bubble-chart'),
+                  ('fig5', 'excess-chart')]:
+    app.callback(Output(id_, 'figure'),
+                 [Input('snapshot-version', 'data')])(serve_figure(name))
+
+
+# redraw the log charts when a new threshold is chosen, the alignment
+# comes from the precomputed crossing indexes in figures.py
+@app.callback(Output('deaths-chart', 'figure'),
+              [Input('deaths-threshold', 'value')],
+              [State('snapshot-version', 'data')])
+def update_deaths_chart(threshold, version):
+    if threshold is None or threshold == 10:
+        return registry.get_figure('fig2', version)
+    return registry.build_figure('fig2', version, threshold)
+
+
+@app.callback(Output('cases-chart', 'figure'),
+              [Input('cases-threshold', 'value')],
+              [State('snapshot-version', 'data')])
+def update_cases_chart(threshold, version):
+    if threshold is None or threshold == 100:
+        return registry.get_figure('fig3', version)
+    return registry.build_figure('fig3', version, threshold)
+
+
+# redraw the density chart for the chosen week, the regressions for every
+# week are fitted together when the data is loaded
+@app.callback(Output('density-chart', 'figure'),
+              [Input('density-week', 'value')],
+              [State('snapshot-version', 'data')])
+def update_density_chart(week, version):
+    if week is None or week == 45:
+        return registry.get_figure('fig6', version)
+    return registry.build_figure('fig6', version, week)
+
+
+# readiness check, reports which figures are built
+@application.route('/ready')
+def ready():
+    figures = registry.status()
+    code = 200 if all(figures.values()) else 503
+    return flask.jsonify(ready=code == 200, figures=figures,
+                         transport=registry.transport()), code
+
+
+# build the figures in the background so the server can answer straight away,
+# then keep checking for new data and swap it in once it is built
+registry.start_warm_up()
+registry.start_refresher()
+
 if __name__ == '__main__':
     application.run(port=8080)
 
@@ -0,0 +1,68 @@
+# for data managaement
+import os
+import json
+import hashlib
+
+from snapshot import download
+
+
+# prebuilt figures are published under figures/<version>/<name>.json, with
+# figures/latest.json naming the version to serve
+ARTIFACT_DIR = 'figures'
+MANIFEST = ARTIFACT_DIR + '/latest.json'
+
+# the published files the figures are built from. Their contents give the
+# version a set of figures is published under
+DATA_FILES = ['ECDCdata_weekly.feather', 'economistdata.tsv']
+
+
+def data_version(paths):
+    ''' makes a version key from the contents of the files a set of figures
+        was built from, so the same data always gives the same key '''
+    digest = hashlib.sha256()
+    for path in paths:
+        with open(path, 'rb') as f:
+            for chunk in iter(lambda: f.read(1 << 20), b''):
+                digest.update(chunk)
+    return digest.hexdigest()[:16]
+
+
+def figure_key(version, name):
+    ''' the path of a prebuilt figure, relative to where artifacts are kept '''
+    return '{}/{}/{}.json'.format(ARTIFACT_DIR, version, name)
+
+
+def write_figures(figures, version, out_dir=''):
+    ''' writes each figure (a go.Figure or the dict plotly.js takes) as
+        plotly JSON, then the manifest pointing at them, and returns the
+        paths written in the order to publish them '''
+    from plotly.utils import PlotlyJSONEncoder
+
+    paths = []
+    for name, fig in figures.items():
+        path = os.path.join(out_dir, figure_key(version, name))
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, 'w') as f:
+            json.dump(fig, f, cls=PlotlyJSONEncoder)
+        paths.append(path)
+
+    # the manifest goes last, so it never names figures that are not there
+    path = os.path.join(out_dir, MANIFEST)
+    with open(path, 'w') as f:
+        json.dump(dict(version=version, figures=list(figures)), f)
+    paths.append(path)
+    return paths
+
+
+def read_manifest():
+    ''' returns the published manifest: the version and its figure names '''
+    path, changed = download(MANIFEST)
+    with open(path) as f:
+        return json.load(f)
+
+
+def read_figure(version, name):
+    ''' returns a prebuilt figure as a dict, ready for dcc.Graph '''
+    path, changed = download(figure_key(version, name))
+    with open(path) as f:
+        return json.load(f)
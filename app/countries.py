@@ -0,0 +1,146 @@
+# for data managaement
+import os
+import json
+import hashlib
+import numpy as np
+import pandas as pd
+
+from snapshot import CACHE_DIR, write_snapshot, read_snapshot
+
+
+# names as published by the ECDC mapped to the names shown on the dashboard
+COUNTRY_ALIASES = {
+    'Democratic_Republic_of_the_Congo': 'D.R.C',
+    'Falkland_Islands_(Malvinas)': 'Falklands',
+    'Cases_on_an_international_conveyance_Japan': 'Cruise Ship (Japan)',
+    'Saint_Vincent_and_the_Grenadines': 'St.Vincent & the Grenadines',
+    'United_States_Virgin_Islands': 'U.S Virgin Islands',
+}
+
+# the only columns holding country names
+NAME_COLUMNS = ['countriesAndTerritories']
+
+# names used by other sources mapped to ISO3 codes, for names that are not
+# the short name (the part before any comma) in continents.csv
+ISO_ALIASES = {
+    'Britain': 'GBR',
+    'United Kingdom': 'GBR',
+    'United States': 'USA',
+    'Istanbul (Turkey)': 'TUR',
+    'South Korea': 'KOR',
+    'Russia': 'RUS',
+    'Czechia': 'CZE',
+    'Slovakia': 'SVK',
+    'North Macedonia': 'MKD',
+    'Syria': 'SYR',
+    'Laos': 'LAO',
+    'World': 'WLD',
+}
+
+# the reference data bundled with the app, plus entries it lacks
+REFERENCE_CSV = os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                             'assets', 'continents.csv')
+EXTRA_COUNTRIES = [dict(iso3='WLD', name='World', continent=np.nan),
+                   dict(iso3='XKX', name='Kosovo', continent='Europe')]
+
+
+def normalise_names(data, columns=NAME_COLUMNS, aliases=COUNTRY_ALIASES):
+    ''' renames countries using the alias table
+        each distinct name is looked up once and the result is broadcast
+        back to the rows, so the cost is set by the number of countries '''
+    for col in columns:
+        codes, uniques = pd.factorize(data[col])
+        renamed = np.array([aliases.get(x, x) for x in uniques] + [np.nan],
+                           dtype=object)
+        # factorize marks missing names with -1, which picks the trailing nan
+        data[col] = renamed[codes]
+    return data
+
+
+def build_country_index(data, col='countriesAndTerritories'):
+    ''' maps each country to the (start, stop) rows of its block
+        data must already be sorted (or at least grouped) by country, so
+        every country's rows sit next to each other '''
+    names = data[col].to_numpy()
+    if len(names) == 0:
+        return {}
+
+    breaks = np.flatnonzero(names[1:] != names[:-1]) + 1
+    starts = np.r_[0, breaks]
+    stops = np.r_[breaks, len(names)]
+
+    index = dict(zip(names[starts], zip(starts, stops)))
+    if len(index) != len(starts):
+        raise ValueError('data must be sorted by {} to be indexed'.format(col))
+    return index
+
+
+def country_block(data, index, country):
+    ''' returns the rows of a single country as a slice, numbered from 0 '''
+    start, stop = index[country]
+    return data.iloc[start:stop].reset_index(drop=True)
+
+
+# Reference registry: every country gets a compact integer key, so joins and
+# group-bys run on integers rather than names or ISO codes
+
+
+def reference_version(path=REFERENCE_CSV):
+    ''' makes a version key from the reference csv and the alias tables '''
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        digest.update(f.read())
+    digest.update(json.dumps([ISO_ALIASES, COUNTRY_ALIASES, EXTRA_COUNTRIES],
+                             sort_keys=True).encode())
+    return digest.hexdigest()[:12]
+
+
+def build_reference(path=REFERENCE_CSV):
+    ''' builds the registry from continents.csv: one row per ISO3 code (the
+        first continent listed is kept) keyed 0, 1, 2... in ISO3 order '''
+    continents = pd.read_csv(path, keep_default_na=False, na_values=[''])
+    ref = pd.DataFrame({'iso3': continents['Three_Letter_Country_Code'],
+                        'name': continents['Country_Name'],
+                        'continent': continents['Continent_Name']})
+    ref = pd.concat([ref, pd.DataFrame(EXTRA_COUNTRIES)], ignore_index=True)
+    ref = ref.dropna(subset=['iso3']).drop_duplicates('iso3')
+    ref = ref.sort_values(by='iso3').reset_index(drop=True)
+    ref['key'] = np.arange(len(ref), dtype=np.int16)
+    return ref
+
+
+def load_reference(path=REFERENCE_CSV, cache_dir=CACHE_DIR):
+    ''' returns the registry, built once per version and cached locally '''
+    cache_path = os.path.join(cache_dir, 'reference-{}.feather'.format(
+        reference_version(path)))
+    if os.path.exists(cache_path):
+        return read_snapshot(cache_path)
+
+    ref = build_reference(path)
+    os.makedirs(cache_dir, exist_ok=True)
+    write_snapshot(ref, cache_path)
+    return ref
+
+
+def keys_for_codes(ref, codes):
+    ''' returns the integer key of each ISO3 code, -1 where it is unknown '''
+    return pd.Index(ref['iso3']).get_indexer(pd.Series(codes).to_numpy()).astype(np.int16)
+
+
+def keys_for_names(ref, names):
+    ''' returns the integer key of each country name, matched on the alias
+        table or the short name in the registry, -1 where it is unknown
+        each distinct name is matched once '''
+    short = ref['name'].str.split(',').str[0].str.strip()
+    lookup = dict(zip(short, ref['iso3']))
+    lookup.update(ISO_ALIASES)
+
+    codes, uniques = pd.factorize(pd.Series(names))
+    unique_keys = keys_for_codes(ref, [lookup.get(x) for x in uniques])
+    return np.append(unique_keys, np.int16(-1))[codes]
+
+
+def lookup(ref, keys, column):
+    ''' returns a registry column for an array of keys (nan where -1) '''
+    values = np.append(ref[column].to_numpy(dtype=object), np.nan)
+    return values[np.asarray(keys)]
@@ -1,13 +1,16 @@
 # for data managaement
+import io
+import os
+import sys
 import numpy as np
 import pandas as pd
+import pyarrow as pa
 import time
 from datetime import datetime, timedelta
 
 # for charting
 import plotly
 import plotly.graph_objects as go
-from sklearn.metrics import mean_squared_error, r2_score
 
 # colours
 #from palettable.colorbrewer.qualitative import Paired_12
@@ -23,18 +26,32 @@ import dash_bootstrap_components as dbc
 # for scraping data
 import bs4
 import requests
-import boto3
 
 from config import ACCESS_KEY,SECRET_KEY
+from rolling import WINDOWS, rolling_sums
+
+# shared modules live in the app folder, see app_path.py
+import app_path
+from snapshot import write_snapshot, read_snapshot, publish, publish_stream, csv_writer
+from storage import get_storage
+from httpcache import get
+from partitions import write_partitions
+from matrix import build_matrices, write_matrices
+from latest import country_colours, build_latest
+from resample import to_weekly, ECDC_LASTS
+from countries import normalise_names, build_country_index, country_block
+from countries import load_reference, keys_for_codes, lookup
+
+# the tsv is kept as an optional export alongside the snapshot
+EXPORT_TSV = os.environ.get('ECDC_EXPORT_TSV', '0') == '1'
 # define functions
 
 
 def make_chart_data(country):
     ''' makes a seperate dataset for a country
-        takes country name as input '''
-    chart_data = data.loc[data['countriesAndTerritories']
-                          == country].reset_index()
-    return chart_data
+        takes country name as input, and slices its block out of the
+        sorted data using the country index '''
+    return country_block(data, country_index, country)
 
 # shifts the data to 'day 0 of the corona virus'
 
@@ -58,105 +75,344 @@ def reindex(df, var, index_=10):
         dta[var] = np.nan
     return dta
 
-def s3_upload(access_key,secret_key, write_path):
-
-    s3 = boto3.client(
-    "s3",
-    aws_access_key_id=access_key,
-    aws_secret_access_key=secret_key
-    )
-    bucket_resource = s3
-    
-    filename = write_path
-    
-    bucket_resource.upload_file(
-    Bucket = 'covid-19-app-data',
-    Filename=filename,
-    Key=filename,
-    ExtraArgs ={'ACL':'public-read'}
-    )
-
 
+# incremental runs pick up from the last snapshot and its carry-over state
+SNAPSHOT_PATH = 'ECDCdata.feather'
+CUBE_PATH = 'ECDCdata_cube.feather'
+LATEST_PATH = 'ECDCdata_latest.feather'
+WEEKLY_PATH = 'ECDCdata_weekly.feather'
+STATE_PATH = 'ECDCdata_state.feather'
+INCREMENTAL = os.environ.get('ECDC_MODE', 'full') == 'incremental'
+
+# stream mode reads the csv a chunk of rows at a time, so memory while it is
+# fetched, parsed and wrangled is set by the chunk size (and the largest
+# country) rather than the file. Only that ingest is bounded: the outputs
+# made from the snapshot afterwards (partitions, cube, weekly data and
+# matrices) are made from the whole of it, as in the other modes
+STREAM = os.environ.get('ECDC_MODE', 'full') == 'stream'
+CHUNK_ROWS = int(os.environ.get('ECDC_CHUNK_ROWS', 50000))
+
+ECDC_URL = 'https://opendata.ecdc.europa.eu/covid19/casedistribution/csv'
+
+# the first ten columns of the csv, read with these types rather than
+# inferred ones
+ECDC_DTYPES = {'dateRep': str, 'day': 'int8', 'month': 'int8', 'year': 'int16',
+               'cases': 'float64', 'deaths': 'float64',
+               'countriesAndTerritories': str, 'geoId': str,
+               'countryterritoryCode': str, 'popData2019': 'float64'}
+
+# length of the longest rolling sum, the state keeps the trailing
+# window - 1 rows
+WINDOW = max(WINDOWS)
+
+
+def make_world(totals):
+    ''' makes the world aggregate rows from cases, deaths and population
+        summed over countries for each date (indexed by date) '''
+    world = totals[['cases', 'deaths', 'popData2019']].copy()
+
+    world['day'] = world.index.day
+    world['month'] = world.index.month
+    world['year'] = world.index.year
+    world['dateRep'] = world.index
+    world['countriesAndTerritories'] = 'World'
+    world['geoId'] = 'WD'
+    world['countryterritoryCode'] = 'WLD'
+    return world.reset_index(drop=True)
+
+
+def label(data, reference):
+    ''' adds the registry key, continent and ISO code, then sorts by country
+        and date '''
+    # Create a continents var, looked up by the registry's integer key
+    data['country_key'] = keys_for_codes(reference, data['countryterritoryCode'])
+    data['Continent_Name'] = lookup(reference, data['country_key'], 'continent')
+    data['Three_Letter_Country_Code'] = lookup(reference, data['country_key'], 'iso3')
+
+    # sort values by country and date
+    data.sort_values(by=['countriesAndTerritories', 'dateRep'],
+                     ascending=True, inplace=True, kind='mergesort')
+    return data.reset_index(drop=True)
+
+
+def prepare(data, reference):
+    ''' parses dates, tidies names, adds the world aggregate and continents
+        then sorts by country and date '''
+    # make datetime
+    data['dateRep'] = pd.to_datetime(data['dateRep'], dayfirst=True)
+
+    # Shorten long country names, e.g. to DRC
+    data = normalise_names(data)
+
+    # create a global aggregate figure for cases and deaths
+    world = make_world(data[['dateRep', 'cases', 'deaths',
+                             'popData2019']].groupby(by='dateRep').sum())
+    data = pd.concat([data, world], ignore_index=True)
+
+    return label(data, reference)
+
+
+def make_cube(data):
+    ''' sums countries' cases, deaths and population into each continent and
+        the world for every date, then adds the same totals, rolling sums and
+        per capita figures as for countries. Returns one row per region and
+        date, a few hundred rows to the countries' many thousands '''
+    countries = data[data['countriesAndTerritories'] != 'World']
+    continents = countries.groupby(
+        by=[countries['Continent_Name'].fillna('Other'), 'dateRep'])[
+        ['cases', 'deaths', 'popData2019']].sum()
+
+    # the world is the sum of the continents, including countries with none
+    world = continents.groupby(level='dateRep').sum().reset_index()
+    world['Continent_Name'] = 'World'
+    continents = continents.reset_index()
+    continents = continents[continents['Continent_Name'] != 'Other']
+
+    cube = pd.concat([world, continents], ignore_index=True)
+    cube = cube.rename(columns={'Continent_Name': 'countriesAndTerritories'})
+    cube.sort_values(by=['countriesAndTerritories', 'dateRep'],
+                     inplace=True, kind='mergesort')
+    cube = add_derived(cube.reset_index(drop=True))
+    return cube.rename(columns={'countriesAndTerritories': 'region'})
+
+
+def add_derived(data, state=None):
+    ''' adds totals, rolling sums, per capita figures and death rates
+        data must be sorted by country and date. If a state from make_state
+        is passed the totals and rolling sums carry on from it, so only
+        rows after the state's last date need to be passed in '''
+    if state is None:
+        state = pd.DataFrame(columns=['countriesAndTerritories', 'dateRep',
+                                      'cases', 'deaths', 'total_cases', 'total_deaths'])
+
+    # running totals pick up from the last total held in the state
+    offsets = state.groupby(by='countriesAndTerritories')[
+        ['total_cases', 'total_deaths']].last()
+
+    # create cumulative sum of deaths and cases by country
+    for var in ['cases', 'deaths']:
+        offset = data['countriesAndTerritories'].map(
+            offsets['total_' + var]).fillna(0)
+        data['total_' + var] = data.groupby(by='countriesAndTerritories')[
+            var].cumsum() + offset
+
+    # create 7, 14 and 28 day rolling sums of deaths and cases, with the
+    # trailing window from the state put in front of each country's new
+    # rows. The new rows keep their index, so the sums are joined back on
+    # by label (a mask, rather than .loc['new'], still works when there are
+    # no new rows)
+    columns = ['countriesAndTerritories', 'dateRep', 'cases', 'deaths']
+    frame = pd.concat([state[columns], data[columns]], keys=['carry', 'new'])
+    frame.sort_values(by=['countriesAndTerritories', 'dateRep'],
+                      inplace=True, kind='mergesort')
+
+    sums = rolling_sums(frame, ['cases', 'deaths'])
+    sums = sums[frame.index.get_level_values(0) == 'new'].droplevel(0)
+    for column in sums:
+        data[column] = sums[column]
+        # and per capita
+        data[column + '_per_cap'] = sums[column] / data['popData2019']
+
+    # Create cumulative deaths and cases per capita
+    data['deaths_per_cap'] = data['total_deaths'] / data['popData2019']
+    data['cases_per_cap'] = data['total_cases'] / data['popData2019']
+
+    # create death rates variable
+    data['death_rate'] = data['total_deaths'] / data['total_cases'] * 100
+    return data
+
+
+def make_state(data):
+    ''' keeps the last WINDOW - 1 rows of each country, which hold the
+        running totals and the trailing window for the rolling sums '''
+    return data.groupby(by='countriesAndTerritories').tail(WINDOW - 1)[
+        ['countriesAndTerritories', 'dateRep', 'cases', 'deaths',
+         'total_cases', 'total_deaths']].reset_index(drop=True)
+
+
+def stream_schema(reference):
+    ''' the schema of the wrangled data, made by putting an empty feed typed
+        as ECDC_DTYPES through label and add_derived, so it does not depend
+        on the values of whichever country comes first. Columns that have no
+        values to be typed by (the reference lookups) are strings '''
+    empty = pd.DataFrame({c: pd.Series(dtype=t) for c, t in ECDC_DTYPES.items()})
+    empty['dateRep'] = pd.to_datetime(empty['dateRep'])
+    schema = pa.Table.from_pandas(add_derived(label(empty, reference)),
+                                  preserve_index=False).schema
+    return pa.schema([pa.field(f.name, pa.string()) if pa.types.is_null(f.type) else f
+                      for f in schema], metadata=schema.metadata)
+
+
+def stream_ingest(source, reference, path, chunk_rows=CHUNK_ROWS):
+    ''' reads the csv from source chunk_rows rows at a time and writes the
+        wrangled data to a snapshot at path as it goes, returning the state
+        The feed must be grouped by country (as the ECDC's is): once the
+        next country starts a country is complete, so its rows are
+        wrangled, written and dropped, and only its state rows are kept
+        The world aggregate is summed chunk by chunk and written last
+        Countries are written in feed order to a scratch file, then copied
+        into path in name order a block at a time, so the snapshot is sorted
+        by country and date as in the other modes '''
+    scratch = path + '.feed'
+    schema = stream_schema(reference)
+    writer = pa.ipc.new_file(scratch, schema)
+    batches = {}
+    written = 0
+    states = []
+    world = None
+    pending = None
+
+    def finish(block):
+        nonlocal written
+        name = block['countriesAndTerritories'].iloc[0]
+        if name in batches:
+            raise ValueError('the feed is not grouped by country: {} '
+                             'appears twice'.format(name))
+        block = add_derived(label(block, reference))
+        # every country is cast to the schema made up front
+        table = pa.Table.from_pandas(block[schema.names], preserve_index=False)
+        # the record batches each country was written as, to copy them later
+        batches[name] = []
+        for batch in table.cast(schema).to_batches():
+            writer.write_batch(batch)
+            batches[name].append(written)
+            written += 1
+        states.append(make_state(block))
+
+    for chunk in pd.read_csv(source, usecols=list(range(0, 10)),
+                             dtype=ECDC_DTYPES, chunksize=chunk_rows):
+        chunk['dateRep'] = pd.to_datetime(chunk['dateRep'], format='%d/%m/%Y')
+        chunk = normalise_names(chunk)
+
+        totals = chunk.groupby(by='dateRep')[['cases', 'deaths', 'popData2019']].sum()
+        world = totals if world is None else world.add(totals, fill_value=0)
+
+        # the last country in the chunk may carry on into the next one
+        if pending is not None:
+            chunk = pd.concat([pending, chunk], ignore_index=True)
+        names = chunk['countriesAndTerritories'].to_numpy()
+        if (names[1:] != names[:-1]).sum() != len(pd.unique(names)) - 1:
+            raise ValueError('the feed is not grouped by country')
+
+        complete = names != names[-1]
+        for name, block in chunk[complete].groupby(by='countriesAndTerritories', sort=False):
+            finish(block)
+        pending = chunk[~complete]
+
+    if pending is not None and len(pending):
+        finish(pending)
+    finish(make_world(world.sort_index()))
+    writer.close()
+
+    # copy the blocks across in name order, reading the scratch file memory
+    # mapped so only one block is held at a time
+    with pa.memory_map(scratch) as mapped:
+        reader = pa.ipc.open_file(mapped)
+        with pa.ipc.new_file(path, schema) as sorted_writer:
+            for name in sorted(batches):
+                for i in batches[name]:
+                    sorted_writer.write_batch(reader.get_batch(i))
+    os.remove(scratch)
+    return pd.concat(states, ignore_index=True)
+
+
+def read_ecdc(url=ECDC_URL):
+    ''' reads the whole csv, fetched through the HTTP cache so it can be
+        recorded and replayed '''
+    return pd.read_csv(
+        io.BytesIO(get(url).content),
+        usecols=list(
+            range(
+                0,
+                10)))
 
 
 # Data read in and feature creation/ data wrangling
 
-data = pd.read_csv(
-    'https://opendata.ecdc.europa.eu/covid19/casedistribution/csv',
-    usecols=list(
-        range(
-            0,
-            10)))
-
-continents = pd.read_csv('https://covid-19-app-data.s3.eu-west-2.amazonaws.com/continents.csv')
-
-# make datetime
-data['dateRep'] = pd.to_datetime(data['dateRep'], dayfirst=True)
-
-# sort values by country and date
-data.sort_values(by=['countriesAndTerritories', 'dateRep'],
-                 ascending=True, inplace=True)
-
-# reindex the data now its sorted to prevent errors when creating aggregates
-data = data.reindex()
-
-# create a global aggregate figure for cases and deaths
-world = data[['dateRep', 'cases', 'deaths',
-              'popData2019']].groupby(by='dateRep').sum()
-
-world['day'] = world.index.day
-world['month'] = world.index.month
-world['year'] = world.index.year
-world['dateRep'] = world.index
-world['countriesAndTerritories'] = 'World'
-world['geoId'] = 'WD'
-world['countryterritoryCode'] = 'WLD'
-data = pd.concat([data, world], ignore_index=True)
-
-# Create a continents var
-
-data = pd.merge(data,
-                continents[['Continent_Name',
-                            'Three_Letter_Country_Code']].drop_duplicates('Three_Letter_Country_Code'),
-                how='left',
-                left_on='countryterritoryCode',
-                right_on='Three_Letter_Country_Code')
-# create cumulative sum of deaths and cases by country and death rate
-data['total_cases'] = data.groupby(by='countriesAndTerritories')[
-    'cases'].cumsum()
-data['total_deaths'] = data.groupby(by='countriesAndTerritories')[
-    'deaths'].cumsum()
-
-# create 7 day rolling average of deaths and cases
-
-
-data['deaths_7_day_sum'] = data.groupby(by=['countriesAndTerritories'])[
-    'deaths'].rolling(7).sum().values
-data['cases_7_day_sum'] = data.groupby(by=['countriesAndTerritories'])[
-    'cases'].rolling(7).sum().values
-data['death_rate'] = data['total_deaths'] / data['total_cases'] * 100
-
-# Create cumulative deaths and cases per capita
-data['deaths_per_cap'] = data['total_deaths'] / data['popData2019']
-data['cases_per_cap'] = data['total_cases'] / data['popData2019']
-
-# create death rates variable
-data['death_rate'] = data['total_deaths'] / data['total_cases'] * 100
-
-# Shorten to DRC
-data = data.replace({'Democratic_Republic_of_the_Congo': 'D.R.C'}, regex=True)
-data = data.replace({'Falkland_Islands_(Malvinas)': 'Falklands'}, regex=True)
-data = data.replace({'Democratic_Republic_of_the_Congo': 'D.R.C'}, regex=True)
-data = data.replace(
-    {'Cases_on_an_international_conveyance_Japan': 'Cruise Ship (Japan)'}, regex=True)
-data = data.replace(
-    {'Saint_Vincent_and_the_Grenadines': 'St.Vincent & the Grenadines'}, regex=True)
-data = data.replace(
-    {'United_States_Virgin_Islands': 'U.S Virgin Islands'}, regex=True)
-
-data.to_csv('ECDCdata.tsv',sep='\t', mode='w', encoding = 'UTF-8')
-      
-access_key = ACCESS_KEY
-secret_key = SECRET_KEY
-            
-s3_upload(access_key,secret_key, 'ECDCdata.tsv')
\ No newline at end of file
+# country reference data, built from app/assets and cached locally
+reference = load_reference()
+
+if STREAM:
+    # fetched through the HTTP cache, and parsed as it streams in
+    with get(ECDC_URL, stream=True) as res:
+        res.raise_for_status()
+        res.raw.decode_content = True
+        state = stream_ingest(res.raw, reference, SNAPSHOT_PATH)
+
+    # the rest of the pipeline works on the whole snapshot, read back into
+    # memory
+    data = read_snapshot(SNAPSHOT_PATH)
+elif INCREMENTAL and os.path.exists(SNAPSHOT_PATH) and os.path.exists(STATE_PATH):
+    raw = read_ecdc()
+    state = read_snapshot(STATE_PATH)
+
+    # only rows published after the last processed date are wrangled. If
+    # the ECDC has not published since, everything is already up to date
+    last_date = state['dateRep'].max()
+    raw = raw[pd.to_datetime(raw['dateRep'], dayfirst=True) > last_date]
+    if raw.empty:
+        print('no data after {:%d %b %Y}, nothing to update'.format(last_date))
+        sys.exit(0)
+
+    previous = read_snapshot(SNAPSHOT_PATH)
+    new = add_derived(prepare(raw, reference), state)
+
+    # both blocks are sorted, so a stable sort just merges them
+    data = pd.concat([previous, new], ignore_index=True)
+    data.sort_values(by=['countriesAndTerritories', 'dateRep'],
+                     inplace=True, kind='mergesort')
+    data.reset_index(drop=True, inplace=True)
+    state = make_state(pd.concat([state, new[state.columns]]).sort_values(
+        by=['countriesAndTerritories', 'dateRep'], kind='mergesort'))
+else:
+    data = add_derived(prepare(read_ecdc(), reference))
+    state = make_state(data)
+
+write_snapshot(state, STATE_PATH)
+
+# the data is sorted by country and date, so each country is one block
+country_index = build_country_index(data)
+
+# write a typed columnar snapshot, the app memory maps this on start up
+# (stream mode has written it already)
+if not STREAM:
+    write_snapshot(data, SNAPSHOT_PATH)
+
+# and the same split by continent, for loaders that only need some countries
+partition_paths = write_partitions(data)
+
+# world and continent aggregates, so readers need not sum the countries
+write_snapshot(make_cube(data), CUBE_PATH)
+
+# the daily data summed into ISO weeks (cases_weekly, deaths_weekly), the
+# grain the dashboard's charts and the Economist data use
+weekly = to_weekly(data, lasts=ECDC_LASTS + ['country_key', 'Continent_Name'])
+write_snapshot(weekly, WEEKLY_PATH)
+
+# and as dense weeks x countries arrays, one per metric, a row per week
+matrix_paths = write_matrices(build_matrices(weekly, date='week_start'))
+
+# one row per country at its latest week, coloured as in the charts, for
+# the headline and bubble charts
+colours, colour_dict2 = country_colours(weekly)
+write_snapshot(build_latest(weekly.assign(colour=colours), build_country_index(weekly)),
+               LATEST_PATH)
+
+storage = get_storage(access_key=ACCESS_KEY, secret_key=SECRET_KEY)
+
+publish(SNAPSHOT_PATH, storage)
+publish(CUBE_PATH, storage)
+publish(LATEST_PATH, storage)
+publish(WEEKLY_PATH, storage)
+
+# the partition index is published last
+for path in partition_paths:
+    publish(path, storage)
+
+# as are the matrix axes
+for path in matrix_paths:
+    publish(path, storage)
+
+if EXPORT_TSV:
+    publish_stream('ECDCdata.tsv',
+                   csv_writer(data, sep='\t', encoding='UTF-8'), storage)
\ No newline at end of file
@@ -0,0 +1,11 @@
+# for data managaement
+import os
+import sys
+
+
+# the scripts in data_creation share modules with the app (snapshot, storage,
+# countries and so on), which live in the app folder one level up. Importing
+# this module puts that folder on the path, so scripts import it before them
+APP_DIR = os.path.abspath(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+if APP_DIR not in sys.path:
+    sys.path.insert(0, APP_DIR)
@@ -0,0 +1,44 @@
+# for data managaement
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+# for scraping data
+import requests
+from urllib3.util.retry import Retry
+
+# shared modules live in the app folder, see app_path.py
+import app_path
+from httpcache import CachingAdapter
+
+
+# number of files downloaded at once
+WORKERS = 8
+
+
+def make_session(workers=WORKERS):
+    ''' makes a session whose connection pool is big enough for every worker
+        to keep its connection open, retrying failed requests a few times
+        requests go through the HTTP cache, see httpcache.py '''
+    session = requests.Session()
+    adapter = CachingAdapter(pool_connections=workers, pool_maxsize=workers,
+                          max_retries=Retry(total=3, backoff_factor=0.5,
+                                            status_forcelist=[500, 502, 503, 504]))
+    session.mount('https://', adapter)
+    session.mount('http://', adapter)
+    return session
+
+
+def fetch_all(urls, workers=WORKERS, session=None):
+    ''' downloads urls concurrently over one pooled session
+        returns a list of (url, content, seconds taken) in the order of urls '''
+    if session is None:
+        session = make_session(workers)
+
+    def fetch(url):
+        start = time.perf_counter()
+        res = session.get(url)
+        res.raise_for_status()
+        return url, res.content, time.perf_counter() - start
+
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        return list(pool.map(fetch, urls))
@@ -0,0 +1,31 @@
+# for data managaement
+import os
+
+from config import ACCESS_KEY,SECRET_KEY
+
+# shared modules live in the app folder, see app_path.py
+import app_path
+from figures import FIGURES, load_ecdc, load_economist
+from snapshot import CACHE_DIR, publish
+from artifacts import DATA_FILES, data_version, write_figures
+from storage import get_storage
+
+
+# Builds every dashboard figure once per data version and publishes them as
+# plotly JSON, so the app can serve them without doing the wrangling itself.
+# Run after ECDCdata.py and economistdata.py have published their outputs.
+
+data = dict(ecdc=load_ecdc())
+data['economist'] = load_economist(data['ecdc'])
+
+# the version is taken from the published files the figures were built from
+version = data_version([os.path.join(CACHE_DIR, name) for name in DATA_FILES])
+
+figures = {name: builder(data[source])
+           for name, (source, builder) in FIGURES.items()}
+
+storage = get_storage(access_key=ACCESS_KEY, secret_key=SECRET_KEY)
+
+# the manifest is written (and uploaded) last
+for path in write_figures(figures, version):
+    publish(path, storage)
@@ -0,0 +1,49 @@
+# for data managaement
+import numpy as np
+import pandas as pd
+
+
+# lengths, in rows, of the rolling sums made for each country
+WINDOWS = [7, 14, 28]
+
+
+def segment_positions(groups):
+    ''' the position of each row within its run of equal groups, so the
+        first row of every country is 0 '''
+    groups = np.asarray(groups)
+    rows = np.arange(len(groups))
+    new = np.ones(len(groups), dtype=bool)
+    new[1:] = groups[1:] != groups[:-1]
+    return rows - np.maximum.accumulate(np.where(new, rows, 0))
+
+
+def rolling_sums(frame, columns, windows=WINDOWS, group='countriesAndTerritories'):
+    ''' sums each of columns over the trailing windows within each group, for
+        every window in one pass, by differencing cumulative sums
+        frame must be sorted so each group is contiguous. As with
+        rolling(window).sum() a sum is NaN until a group has window rows, or
+        if any value in the window is missing
+        returns a frame with the same index as frame and a column
+        <column>_<window>_day_sum for each column and window '''
+    values = frame[columns].to_numpy(dtype=float)
+    missing = np.isnan(values)
+
+    # running totals with a row of zeros in front, so a window's sum is the
+    # difference of two rows, and a running count of missing values
+    totals = np.zeros((len(values) + 1, len(columns)))
+    np.cumsum(np.where(missing, 0, values), axis=0, out=totals[1:])
+    gaps = np.zeros((len(values) + 1, len(columns)), dtype=np.int64)
+    np.cumsum(missing, axis=0, out=gaps[1:])
+
+    rows = np.arange(1, len(values) + 1)
+    positions = segment_positions(frame[group])
+
+    sums = {}
+    for window in windows:
+        lag = np.maximum(rows - window, 0)
+        out = totals[rows] - totals[lag]
+        out[(positions[:, None] < window - 1) | (gaps[rows] - gaps[lag] > 0)] = np.nan
+        for i, column in enumerate(columns):
+            sums['{}_{}_day_sum'.format(column, window)] = out[:, i]
+
+    return pd.DataFrame(sums, index=frame.index)
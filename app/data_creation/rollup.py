@@ -0,0 +1,23 @@
+# for data managaement
+import pandas as pd
+
+
+# columns summed across a country's regions
+SUM_COLUMNS = ['expected_deaths', 'excess_deaths', 'covid_deaths',
+               'total_deaths', 'non_covid_deaths', 'population']
+
+
+def rollup_regions(df, keys=['country', 'year', 'week'], columns=SUM_COLUMNS):
+    ''' sums subnational rows into national series, for every country that
+        only ships regions (no row where region == country)
+        only weeks where as many regions reported as in the country's best
+        covered week are kept, so partial weeks do not show up as dips '''
+    national = (df['country'] == df['region']).groupby(df['country']).transform('any')
+    regional = df[~national]
+
+    agg = regional.groupby(keys, as_index=False).agg(
+        **{c: (c, 'sum') for c in columns},
+        regions=('population', 'count'))
+
+    complete = agg['regions'] == agg.groupby('country')['regions'].transform('max')
+    return agg[complete].drop(columns='regions').reset_index(drop=True)
@@ -0,0 +1,50 @@
+# for data managaement
+import os
+import json
+import time
+import pandas as pd
+
+# shared modules live in the app folder, see app_path.py
+import app_path
+from snapshot import write_snapshot, read_snapshot
+from httpcache import get
+
+
+DENSITY_URL = "http://api.worldbank.org/v2/country/all/indicator/EN.POP.DNST?format=json&per_page=30000"
+
+# population density changes about once a year, so a cached copy is reused
+DENSITY_CACHE = 'worldbank_density.feather'
+DENSITY_TTL = float(os.environ.get('WB_CACHE_TTL_DAYS', 30)) * 24 * 60 * 60
+
+
+def download_density(url=DENSITY_URL):
+    ''' downloads the population density indicator, parsing the json as it
+        streams in and building the frame column by column '''
+    with get(url, stream=True) as res:
+        res.raise_for_status()
+        res.raw.decode_content = True
+        records = json.load(res.raw)[1]
+
+    return pd.DataFrame({'year': [i['date'] for i in records],
+                         'ISO': [i['countryiso3code'] for i in records],
+                         'density': [i['value'] for i in records]})
+
+
+def latest_density(wb):
+    ''' keeps the latest year with a value for each ISO code '''
+    wb = wb.dropna(axis=0)
+    wb = wb[wb['ISO'] != '']
+    wb = wb.assign(year=wb['year'].astype(int))
+    return wb.loc[wb.groupby(by='ISO')['year'].idxmax()].reset_index(drop=True)
+
+
+def load_density(cache_path=DENSITY_CACHE, ttl=DENSITY_TTL):
+    ''' returns the latest population density for each ISO code, from the
+        cache if it is younger than ttl seconds, otherwise downloaded and
+        written to the cache '''
+    if os.path.exists(cache_path) and time.time() - os.path.getmtime(cache_path) < ttl:
+        return read_snapshot(cache_path)
+
+    den = latest_density(download_density())
+    write_snapshot(den, cache_path)
+    return den
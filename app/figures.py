@@ -7,7 +7,6 @@ from datetime import datetime, timedelta
 # for charting
 import plotly
 import plotly.graph_objects as go
-from sklearn.metrics import mean_squared_error, r2_score
 
 # colours
 #from palettable.colorbrewer.qualitative import Paired_12
@@ -24,70 +23,24 @@ import dash_bootstrap_components as dbc
 import bs4
 import requests
 
+# typed snapshots published by data_creation/ECDCdata.py
+from snapshot import fetch_snapshot, download
+from partitions import load_partitions
+from matrix import load_matrices
+from latest import country_colours, build_latest
+from resample import at_grain, sum_to_weeks, ECDC_LASTS
+from countries import build_country_index, country_block
+from thresholds import build_crossing_index, build_matrix_crossing_index, aligned_series
+from regression import fit_by_group
 
 # define functions
 
 
-def make_chart_data(country):
-    ''' makes a seperate dataset for a country
-        takes country name as input '''
-    chart_data = data.loc[data['countriesAndTerritories']
-                          == country].reset_index()
-    return chart_data
-
-# shifts the data to 'day 0 of the corona virus'
-
-
-def reindex(df, var, index_=10):
-    ''' creates a data series which shifts data so that the day
-    where the criteria index_ is reached is at index 0
-    Note cases are indexed to weekly total, while deaths to cumulative total'''
-    dta = df.copy()
-
-    # First we need to identify the day at which the minimum number of cases/deaths is reached
-    # some countries have no data so the try/except allows the function to
-    # ignore them
-    try:
-        first_day = dta[dta[var] > index_].index[0]
-
-    # The cumulative cases/deaths data are then shifted back so that the first
-    # day index_ is exceeded becomes index 0
-        dta[var] = dta[var].shift(-first_day)
-    except BaseException:
-        dta[var] = np.nan
-    return dta
-
-
-# Data read in and feature creation/ data wrangling
-data = pd.read_csv('https://covid-19-app-data.s3.eu-west-2.amazonaws.com/ECDCdata.tsv', sep ='\t')
-data['dateRep'] = pd.to_datetime(data['dateRep'], dayfirst=True)
-# Formatting
-# colours
-
-# sort values so hopefully countries with similar number of cases end up
-# with different colours
-a = data.sort_values(
-    by=['total_cases', 'countriesAndTerritories', 'dateRep'], ascending=True)
-
-colour_list = (Tableau_20.hex_colors *
-               int(len(data['countriesAndTerritories'].unique()) /
-                   len(Tableau_20.hex_colors) +
-                   1))[:len(data['countriesAndTerritories'].unique())]
-colour_dict = dict(
-    zip(list(dict.fromkeys(a['countriesAndTerritories'])), colour_list))
-data['colour'] = [colour_dict[x] for x in data['countriesAndTerritories']]
-
-## colour list for excess deaths chart
-
-colour_list2 = (Tableau_20.hex_colors *
-               int(len(data['countryterritoryCode'].unique()) /
-                   len(Tableau_20.hex_colors) +
-                   1))[:len(data['countryterritoryCode'].unique())]
-colour_dict2 = dict(
-    zip(list(dict.fromkeys(a['countryterritoryCode'])), colour_list2))
-
-
-
+#
+title_font_family = 'Arial'
+title_font_size = 14
+x_title_font_size = 11
+y_title_font_size = 11
 
 # colour dictionary for continents
 colours = {"Asia": "royalblue",
@@ -98,26 +51,132 @@ colours = {"Asia": "royalblue",
            "South America": 'mediumslateblue',
            "nan": "peru"}
 
-#
-title_font_family = 'Arial'
-title_font_size = 14
-x_title_font_size = 11
-y_title_font_size = 11
 
-# create a 'date' variable that is a string
-data['date'] = [pd.to_datetime(str(x)).strftime('%d %b')
-                for x in data['dateRep']]
+# Data read in and feature creation/ data wrangling
+
+def load_ecdc(countries=None, start=None, end=None):
+    ''' reads the ECDC data at the weekly grain, the grain the charts use,
+        and adds the colours and lookups shared by the charts, returned as a
+        dict
+        given a list of countries and/or a date range only the matching
+        parts of the partitioned (daily) snapshot are read and summed into
+        weeks here, e.g. for a country's own view of the dashboard '''
+    # the snapshot keeps dtypes, so dateRep arrives as a datetime already
+    if countries is None and start is None and end is None:
+        grains = {'weekly': fetch_snapshot('ECDCdata_weekly.feather')}
+    else:
+        grains = {'daily': load_partitions(countries, start, end)}
+    data = at_grain(grains, 'weekly',
+                    lasts=ECDC_LASTS + ['country_key', 'Continent_Name'])
+
+    # the weeks are sorted by country and date, so each country is one block
+    country_index = build_country_index(data)
+
+    # Formatting
+    # colours, also for the excess deaths chart, keyed by country key
+    data['colour'], colour_dict2 = country_colours(data)
+
+    # one row per country at its latest report, as published by the ETL
+    # (or made here when only some of the data was loaded)
+    if countries is None and start is None and end is None:
+        latest = fetch_snapshot('ECDCdata_latest.feather')
+    else:
+        latest = build_latest(data, country_index)
+
+    # create a 'date' variable that is a string
+    data['date'] = [pd.to_datetime(str(x)).strftime('%d %b')
+                    for x in data['dateRep']]
+
+    # calculate the date of latest data included and make it a string
+    # (a filter can match no rows, and then there is no date to show)
+    latest_data = data['dateRep'].max()
+    latest_data_string = '' if pd.isnull(latest_data) else latest_data.strftime("%d %b %Y")
+
+    # the latest week is usually still going, and its totals cover fewer
+    # than seven days. The countries whose last week is partial are kept,
+    # so the charts can leave that week out or mark it
+    partial = set()
+    if 'days' in data:
+        days = data['days'].to_numpy()
+        partial = {name for name, (start, stop) in country_index.items()
+                   if days[stop - 1] < 7}
+
+    # first-crossing search indexes on the weekly grain, so any threshold
+    # can be charted without copying each country's data. They are made from
+    # the published weeks x countries arrays, memory mapped, or from the data
+    # when only some of it was loaded. A column the data lacks is skipped,
+    # and its chart is left empty
+    if countries is None and start is None and end is None:
+        matrices = load_matrices(['deaths_weekly', 'cases_weekly'])
+        crossings = {var: build_matrix_crossing_index(matrices, var)
+                     for var in matrices['values']}
+    else:
+        crossings = {var: build_crossing_index(data, country_index, var)
+                     for var in ['deaths_weekly', 'cases_weekly'] if var in data}
+
+    return dict(data=data,
+                country_index=country_index,
+                latest=latest,
+                grains=grains,
+                colour_dict2=colour_dict2,
+                latest_data=latest_data,
+                latest_data_string=latest_data_string,
+                partial=partial,
+                crossings=crossings)
+
+
+def ecdc_at_grain(ecdc, grain):
+    ''' the ECDC data at the 'daily' or 'weekly' grain, resampled once and
+        then kept with the data '''
+    return at_grain(ecdc['grains'], grain,
+                    lasts=ECDC_LASTS + ['country_key', 'Continent_Name', 'colour'])
+
+
+def load_cube():
+    ''' reads the world and continent aggregates made by the ETL, one row
+        per region and date, returned as a dict with an index of each
+        region's rows '''
+    cube = fetch_snapshot('ECDCdata_cube.feather')
+    return dict(data=cube, region_index=build_country_index(cube, 'region'))
+
+
+def load_economist(ecdc):
+    ''' reads the Economist excess deaths data, coloured to match the ECDC
+        charts, returned as a dict '''
+    path, changed = download('economistdata.tsv')
+    df_chart = pd.read_csv(path, sep ='\t')
+    df_chart['expected_deaths_per_mil'] = df_chart.expected_deaths/df_chart.population*1000000
+    df_chart['excess_deaths_per_mil'] = df_chart.excess_deaths/df_chart.population*1000000
+    df_chart['total_deaths_per_mil'] = df_chart.total_deaths/df_chart.population*1000000
+
+    df_chart['colour'] = df_chart['country_key'].map(ecdc['colour_dict2'])
+
+    # the deaths the ECDC reported in each of the Economist's weeks, joined
+    # on the country key. The Economist's weeks do not all run Monday to
+    # Sunday, so they are summed from the ECDC data at the daily grain
+    daily = ecdc_at_grain(ecdc, 'daily')
+    weeks = pd.DataFrame({'country_key': df_chart['country_key'],
+                          'end_date_week': pd.to_datetime(df_chart['end_date_week'])})
+    df_chart['reported_deaths'] = sum_to_weeks(daily[daily['country_key'] >= 0], weeks, 'deaths')
+    df_chart['reported_deaths_per_mil'] = df_chart.reported_deaths/df_chart.population*1000000
+
+    # group each country's weeks together (keeping their order) and index them
+    df_chart = df_chart.sort_values(by='country', kind='mergesort').reset_index(drop=True)
+    econ_index = build_country_index(df_chart, 'country')
+
+    # excess deaths v density regressions for every week, fitted together
+    fits = fit_by_group(df_chart['density'],
+                        df_chart['cumulative_excess_deaths_per_mil'],
+                        df_chart['week'])
+
+    return dict(df_chart=df_chart, econ_index=econ_index, fits=fits)
 
 
 # create objects to be used universally
 # create a list of date strings to cycle through for animations
-days = data['dateRep'][data['dateRep'] > pd.to_datetime(
-    '31-12-2019')].sort_values(ascending=True).unique()
-days = [pd.to_datetime(str(x)).strftime('%d %b') for x in days]
-
-# calculate the date of latest data included and make it a string
-latest_data = data['dateRep'].max()
-latest_data_string = latest_data.strftime("%d %b %Y")
+# days = data['dateRep'][data['dateRep'] > pd.to_datetime(
+#     '31-12-2019')].sort_values(ascending=True).unique()
+# days = [pd.to_datetime(str(x)).strftime('%d %b') for x in days]
 
 ###################################################################
 
@@ -397,18 +456,7 @@ latest_data_string = latest_data.strftime("%d %b %Y")
 
 #################################################################################################
 
-# deaths log chart
-
-# choose the countries we want on the plot
-countries = data['countriesAndTerritories'].unique()
-
-# choose whether we want to plot total_cases or total_deaths
-cat_ = 'deaths'  # deaths / cases
-type_ = '_weekly'  # '_7_day_sum' / 'total_' /''
-var = cat_ + type_
-
-# choose how many cumulative deaths/or cases to use as point 0
-index_ = 10
+# log charts of deaths and cases since a threshold was reached
 
 # list the countries you want to be on there as a default
 default_list = [
@@ -419,690 +467,426 @@ default_list = [
     'Switzerland',
     'India']
 
-# calculate the date of latest data included and make it a string
-latest_data = data['dateRep'].max()
-latest_data_string = latest_data.strftime("%d %b %Y")
-
-# define plot title and axis titles
-
-if type_ == '_weekly':
-    plot_title = "<b>COVID-19 " + cat_.capitalize() + ': weekly total </b><BR>' + latest_data_string +  '<br><span style="font-size: 11px;">Source: European Centre for Disease Prevention and Control</span>'
-elif type_ == 'total_':
-    plot_title = '<b>COVID-19 ' + cat_.capitalize() + '</b> <BR> cumulative total <BR>' + latest_data_string + '<br><span style="font-size: 11px;">Source: European Centre for Disease Prevention and Control</span>'
-else:
-    plot_title = '<b>COVID-19 ' + cat_.capitalize() + '</b><BR>' + latest_data_string + '<br><span style="font-size: 11px;">Source: European Centre for Disease Prevention and Control</span>'
 
+def log_chart(ecdc, cat_, index_, total_label, y_range):
+    ''' makes a log chart of weekly deaths or cases for every country,
+        shifted so the week index_ was first exceeded is at 0
+        takes the ecdc data, 'deaths' or 'cases', the threshold, the title's
+        description of the total and the range of the y axis '''
+    var = cat_ + '_weekly'
+
+    plot_title = "<b>COVID-19 " + cat_.capitalize() + ": " + total_label + " </b><BR>" + ecdc['latest_data_string'] + '<br><span style="font-size: 11px;">Source: European Centre for Disease Prevention and Control</span>'
+    x_title = "Days since " + str(index_) + " " + cat_ + " reached</b>"
+
+    # the figure is built as the plain dict plotly.js takes (dcc.Graph
+    # accepts it as is), as validating a go.Figure of every country's trace
+    # costs far more than building it. So it is written out in full, with
+    # the default template go.Figure would have added
+    traces = []
+    # each country's colour, from the first row of its block
+    colour = ecdc['data']['colour'].to_numpy()
+    colours = {name: colour[start] for name, (start, stop) in ecdc['country_index'].items()}
+
+    crossing = ecdc['crossings'].get(var)
+    series = [] if crossing is None else aligned_series(crossing, index_)
+    for i, start, y in series:
+        # a partial last week would show as a fall, so it is left out
+        if i in ecdc['partial']:
+            y = y[:-1]
+        name = ' '.join(i.split('_'))
+        data_dict = dict(type='scatter',
+                         x=np.arange(len(y)),
+                         y=y,
+                         mode='lines',
+                         line=dict(shape='linear', color=colours.get(i)),
+                         # Removes the underscores in the legend names for
+                         # countries
+                         name=name,
+                         # Removes the underscores in the hoverlabel names
+                         text=[name] * len(y),
+                         hovertemplate="<br><b>%{text}</b><br><i> Weekly " + cat_.capitalize() + "</i>: %{y:,}<extra></extra>")  # formats the hoverlabels
+        if i not in default_list:
+            data_dict['visible'] = 'legendonly'
+        traces.append(data_dict)
+
+    layout = dict(
+        title=dict(text=plot_title, font=dict(
+            size=title_font_size, family=title_font_family)),
+        xaxis=dict(title=dict(text=x_title, font=dict(size=x_title_font_size)),
+                   range=[0, 50]),
+        yaxis=dict(type='log',
+                   title=dict(text=x_title, font=dict(size=x_title_font_size)),
+                   range=y_range),
+        template=default_template())
+
+    return dict(data=traces, layout=layout)
+
+
+_template = None
+
+
+def default_template():
+    ''' plotly's default template as a dict, made once '''
+    global _template
+    if _template is None:
+        import plotly.io as pio
+        _template = pio.templates[pio.templates.default].to_plotly_json()
+    return _template
+
+
+def make_fig2(ecdc, index_=10):
+    ''' deaths log chart, from when index_ deaths in a week were reached '''
+    return log_chart(ecdc, 'deaths', index_, 'weekly total', [0, 5])
+
+
+def make_fig3(ecdc, index_=100):
+    ''' log chart cases, from when index_ cases in a week were reached '''
+    return log_chart(ecdc, 'cases', index_, '7 day total', [0, 7])
 
-x_title = "Days since " + str(index_) + " " + cat_ + " reached</b>"
-y_title = cat_.capitalize() + " (log scale)"
 
+# bubble scatter chart
 
-# Build traces to go on the plot
-
-
-figure = {
-    'data': [],
-    'layout': {},
-    'config': {'scrollzoom': False}
-}
-
-dfs = dict()
-annotations = []
-traces = []
-
-for i in countries:
-    try:
-        if i in default_list:
-            dfs[i] = reindex(make_chart_data(i), var, index_)
-            data_dict = dict(type='scatter',
-                             x=dfs[i].index,
-                             y=dfs[i][var],
-                             mode='lines',
-                             line=dict(shape='hv', color=dfs[i]['colour'][0]),
-                             marker=dict(),
-                             line_shape='linear',
-                             # Removes the underscores in the legend names for
-                             # countries
-                             name=' '.join(i.split('_')),
-                             # Removes the underscores in the hoverlabel names
-                             text=[' '.join(x.split('_'))
-                                   for x in dfs[i]['countriesAndTerritories']],
-                             hovertemplate="<br><b>%{text}</b><br><i> Weekly " + cat_.capitalize() + "</i>: %{y:,}<extra></extra>")  # formats the hoverlabels
-            traces.append(data_dict)
-        else:
-            dfs[i] = reindex(make_chart_data(i), var, index_)
-            data_dict = dict(type='scatter',
-                             x=dfs[i].index,
-                             y=dfs[i][var],
-                             mode='lines',
-                             line=dict(shape='hv', color=dfs[i]['colour'][0]),
-                             marker=dict(),
-                             line_shape='linear',
-                             # Removes the underscores in the legend names for
-                             # countries
-                             name=' '.join(i.split('_')),
-                             # Removes the underscores in the hoverlabel names
-                             text=[' '.join(x.split('_'))
-                                   for x in dfs[i]['countriesAndTerritories']],
-                             hovertemplate="<br><b>%{text}</b><br><i> Weekly " + \
-                             cat_.capitalize() + "</i>: %{y:,}<extra></extra>",
-                             visible='legendonly')  # formats the hoverlabels
-            traces.append(data_dict)
-    except BaseException:
-        pass
-
-
-# create traces for the lines you want to plot (as for the other lines)
-
-three_days = dict(type='scatter',
-                  x=np.array(range(0, 90)),
-                  y=index_ * (2**(1 / 3))**np.array(range(0, 90)),
-                  mode='lines',
-                  line=dict(color='#999999', shape='hv', dash='dot'),
-                  line_shape='linear',
-                  name='Doubling every three days',
-                  hoverinfo='skip')
-
-seven_days = dict(type='scatter',
-                  x=np.array(range(0, 90)),
-                  y=index_ * (2**(1 / 7))**np.array(range(0, 90)),
-                  mode='lines',
-                  line=dict(color='#999999', shape='hv', dash='dot'),
-                  line_shape='linear',
-                  name='Doubling every week',
-                  hoverinfo='skip')
-
-# add the lines to the list of traces to plot
-# traces.append(three_days)
-# traces.append(seven_days)
-
-figure['data'] = traces
-
-# add annotations to the lines so people can see what they are
-
-# annotations.append(dict(xref='paper',
-#                         x=0.5,
-#                         y=4.7,
-#                         text='Doubling every <BR> 3 days',
-#                         font=dict(family='Arial', size=10), showarrow=False))
-# annotations.append(dict(xref='paper',
-#                         x=0.93,
-#                         y=3.8,
-#                         text='Doubling every <BR> week',
-#                         font=dict(family='Arial', size=10), showarrow=False))
-
-
-# add a footnote
-
-#footnote = dict(xref='paper',
-#                 xanchor='right',
-#                 x=1,
-#                yanchor='top',
-#                y=np.log10(index_),
-#                text='<BR> <BR> <BR> <BR> <BR>Sources: Chart by Rachel Lund (2020) https://github.com/LUNDR/covid-19; data from https://www.ecdc.europa.eu',
-#               font=dict(family='Arial',size=10),showarrow=False)
-#annotations.append(footnote)
-
-
-figure['layout'] = dict(
-    yaxis_type="log", title=plot_title, titlefont=dict(
-        size=title_font_size, family=title_font_family), xaxis=dict(
-            title=dict(
-                text=x_title, font=dict(
-                    size=x_title_font_size)), range=[
-                        0, 50]), yaxis=dict(
-                            title=dict(
-                                text=x_title, font=dict(
-                                    size=x_title_font_size)), range=[
-                                        0, 5]))
-
-
-fig2 = go.Figure(figure)
-
-# log chart cases
-
-# choose whether we want to plot total_cases or total_deaths
-cat_ = 'cases'  # deaths / cases
-type_ = '_weekly'  # '_7_day_sum' / 'total_' /''
-var = cat_ + type_
-
-# choose how many cumulative deaths/or cases to use as point 0
-index_ = 100
-
-# list the countries you want to be on there as a default
-default_list = [
-    'United_States_of_America',
+def make_fig4(ecdc):
+    ''' bubble chart of cases v deaths per 100,000 people at the latest date '''
+    data = ecdc['data']
+
+    # define titles
+    x_title = 'Cases per 100,000 population'
+    y_title = 'Deaths per 100,000 population'
+    plot_title = '<b>Total cases of Covid-19 v Total deaths : per 100,000 population</b><BR>' + ecdc['latest_data_string']  + '<br><span style="font-size: 11px;">Source: European Centre for Disease Prevention and Control</span>'
+
+    # what to show to start
+    default_list = [
+        'United_States_of_America',
+        'France',
+        'Netherlands',
+        'United_Kingdom',
+        'Italy',
+        'Switzerland',
+        'Germany',
+        'South_Korea',
+        'Spain',
     'Brazil',
-    'United_Kingdom',
-    'Spain',
-    'Switzerland',
     'India']
 
-# calculate the date of latest data included and make it a string
-latest_data = data['dateRep'].max()
-latest_data_string = latest_data.strftime("%d %b %Y")
+    # size reference for bubbles
+    sizeref = 2. * max(data['popData2019'], default=0) / (150 ** 2)
+
+
+    figure = {
+        'data': [],
+        'layout': {},
+        'config': {'scrollzoom': False}
+    }
+
+    traces = []
+
+    # one row per country reporting on the latest date, from the latest
+    # table, with the per 100,000 figures worked out for all of them at once
+    latest = ecdc['latest']
+    latest = latest[(latest['dateRep'] == ecdc['latest_data']).to_numpy() &
+                    latest['popData2019'].notna().to_numpy()]
+    x_values = latest['cases_per_cap'].to_numpy() * 100000
+    y_values = latest['deaths_per_cap'].to_numpy() * 100000
+    populations = latest['popData2019'].to_numpy()
+
+    for i, x, y, population, colour in zip(latest['countriesAndTerritories'], x_values,
+                                           y_values, populations, latest['colour']):
+        data_dict = dict(
+            type='scatter',
+            x=[x],
+            y=[y],
+            text=[' '.join(i.split('_'))],
+            marker=dict(
+                color=[colour],
+                size=[population],
+                sizeref=sizeref,
+                sizemode='area',
+                line=dict(
+                    color='#ffffff')),
+            mode='markers',
+            customdata=[population / 1000000],
+            hovertemplate="<br><b>%{text}</b><br>Cases per 100k people: %{x:0.1f}<BR> Deaths per 100k people: %{y:0.1f}<BR> Population (2018) %{customdata:,.0f}M<extra></extra>",
+            name=' '.join(
+                i.split('_')))
+        if i not in default_list:
+            data_dict['visible'] = 'legendonly'
+        traces.append(data_dict)
+
+    figure['data'] = traces
+    figure['layout'] = dict(
+        title=plot_title, titlefont=dict(
+            size=title_font_size, family=title_font_family), xaxis=dict(
+                title=dict(
+                    text=x_title, font=dict(
+                        size=x_title_font_size)), range=[
+                            0, 7000], ), yaxis=dict(
+                                title=dict(
+                                    text=y_title, font=dict(
+                                        size=y_title_font_size)), range=[
+                                            0, 200]))
+
+    return go.Figure(figure)
 
-# define plot title and axis titles
-
-if type_ == '_weekly':
-    plot_title = "<b>COVID-19 " + \
-        cat_.capitalize() + ": 7 day total </b><BR>" + latest_data_string  + '<br><span style="font-size: 11px;">Source: European Centre for Disease Prevention and Control</span>'
-elif type_ == 'total_':
-    plot_title = "<b>COVID-19 " + \
-        cat_.capitalize() + "</b> <BR> cumulative total <BR>" + latest_data_string  + '<br><span style="font-size: 11px;">Source: European Centre for Disease Prevention and Control</span>'
-else:
-    plot_title = "<b>COVID-19 " + cat_.capitalize() + "</b><BR>" + \
-        latest_data_string  + '<br><span style="font-size: 11px;">Source: European Centre for Disease Prevention and Control</span>'
-
-
-x_title = "Days since " + str(index_) + " " + cat_ + " reached</b>"
-y_title = cat_.capitalize() + " (log scale)"
-
-# Build traces to go on the plot
-
-
-figure = {
-    'data': [],
-    'layout': {},
-    'config': {'scrollzoom': False}
-}
-
-dfs = dict()
-annotations = []
-traces = []
-
-for i in countries:
-    try:
-        if i in default_list:
-            dfs[i] = reindex(make_chart_data(i), var, index_)
-            data_dict = dict(type='scatter',
-                             x=dfs[i].index,
-                             y=dfs[i][var],
-                             mode='lines',
-                             line=dict(shape='hv', color=dfs[i]['colour'][0]),
-                             marker=dict(),
-                             line_shape='linear',
-                             # Removes the underscores in the legend names for
-                             # countries
-                             name=' '.join(i.split('_')),
-                             # Removes the underscores in the hoverlabel names
-                             text=[' '.join(x.split('_'))
-                                   for x in dfs[i]['countriesAndTerritories']],
-                             hovertemplate="<br><b>%{text}</b><br><i> Weekly " + cat_.capitalize() + "</i>: %{y:,}<extra></extra>")  # formats the hoverlabels
-            traces.append(data_dict)
-        else:
-            dfs[i] = reindex(make_chart_data(i), var, index_)
-            data_dict = dict(type='scatter',
-                             x=dfs[i].index,
-                             y=dfs[i][var],
-                             mode='lines',
-                             line=dict(shape='hv', color=dfs[i]['colour'][0]),
-                             marker=dict(),
-                             line_shape='linear',
-                             # Removes the underscores in the legend names for
-                             # countries
-                             name=' '.join(i.split('_')),
-                             # Removes the underscores in the hoverlabel names
-                             text=[' '.join(x.split('_'))
-                                   for x in dfs[i]['countriesAndTerritories']],
-                             hovertemplate="<br><b>%{text}</b><br><i> Weekly " + \
-                             cat_.capitalize() + "</i>: %{y:,}<extra></extra>",
-                             visible='legendonly')  # formats the hoverlabels
-            traces.append(data_dict)
-    except BaseException:
-        pass
-
-
-# create traces for the lines you want to plot (as for the other lines)
-
-three_days = dict(type='scatter',
-                  x=np.array(range(0, 90)),
-                  y=index_ * (2**(1 / 3))**np.array(range(0, 90)),
-                  mode='lines',
-                  line=dict(color='#999999', shape='hv', dash='dot'),
-                  line_shape='linear',
-                  name='Doubling every three days',
-                  hoverinfo='skip')
-
-seven_days = dict(type='scatter',
-                  x=np.array(range(0, 90)),
-                  y=index_ * (2**(1 / 7))**np.array(range(0, 90)),
-                  mode='lines',
-                  line=dict(color='#999999', shape='hv', dash='dot'),
-                  line_shape='linear',
-                  name='Doubling every week',
-                  hoverinfo='skip')
-
-# add the lines to the list of traces to plot
-# traces.append(three_days)
-# traces.append(seven_days)
-
-figure['data'] = traces
-
-# add annotations to the lines so people can see what they are
-
-# annotations.append(dict(xref='paper',
-#                         x=0.5,
-#                         y=5.7,
-#                         text='Doubling every <BR> 3 days',
-#                         font=dict(family='Arial', size=10), showarrow=False))
-# annotations.append(dict(xref='paper',
-#                         x=0.93,
-#                         y=4.8,
-#                         text='Doubling every <BR> week',
-#                         font=dict(family='Arial', size=10), showarrow=False))
-
-
-# add a footnote
-
-# footnote = dict(xref='paper',
-#                 xanchor='right',
-#                 x=1,
-#                 yanchor='top',
-#                 y=np.log10(index_),
-#                 text='<BR> <BR> <BR> <BR> <BR>Sources: Chart by Rachel Lund (2020) https://github.com/LUNDR/covid-19; data from https://www.ecdc.europa.eu',
-#                 font=dict(family='Arial',size=10),showarrow=False)
-# annotations.append(footnote)
-
-
-figure['layout'] = dict(
-    yaxis_type="log", title=plot_title,  titlefont=dict(
-        size=title_font_size, family=title_font_family), xaxis=dict(
-            title=dict(
-                text=x_title, font=dict(
-                    size=x_title_font_size)), range=[
-                        0, 50]), yaxis=dict(
-                            title=dict(
-                                text=x_title, font=dict(
-                                    size=x_title_font_size)), range=[
-                                        0,7]))
-
-
-fig3 = go.Figure(figure)
-# bubble scatter chart
-
-# bubble scatter chart
-
-countries = data['countriesAndTerritories'].unique()
-
-# define titles
-x_title = 'Cases per 100,000 population'
-y_title = 'Deaths per 100,000 population'
-plot_title = '<b>Total cases of Covid-19 v Total deaths : per 100,000 population</b><BR>' + latest_data_string  + '<br><span style="font-size: 11px;">Source: European Centre for Disease Prevention and Control</span>'
-
-# what to show to start
-default_list = [
-    'United_States_of_America',
-    'France',
-    'Netherlands',
-    'United_Kingdom',
-    'Italy',
-    'Switzerland',
-    'Germany',
-    'South_Korea',
-    'Spain',
-'Brazil',
-'India']
-
-# size reference for bubbles
-sizeref = 2. * max(data['popData2019']) / (150 ** 2)
-
-
-figure = {
-    'data': [],
-    'layout': {},
-    'config': {'scrollzoom': False}
-}
-
-traces = []
-
-for i in countries:
-    try:
-        chart_data = data.loc[(data['dateRep'] == max(data['dateRep'])) & (
-            data['countriesAndTerritories'] == i)]
-        if np.isnan(chart_data['popData2019'].tolist()[0]):
-            pass
-        elif i in default_list:
-            data_dict = dict(
-                type='scatter',
-                x=list(
-                    chart_data['cases_per_cap'] *
-                    100000),
-                y=list(
-                    chart_data['deaths_per_cap'] *
-                    100000),
-                text=[
-                    ' '.join(
-                        x.split('_')) for x in chart_data['countriesAndTerritories']],
-                marker=dict(
-                    color=chart_data['colour'],
-                    size=chart_data['popData2019'],
-                    sizeref=sizeref,
-                    sizemode='area',
-                    line=dict(
-                        color='#ffffff')),
-                mode='markers',
-                customdata=chart_data['popData2019'] /
-                1000000,
-                hovertemplate="<br><b>%{text}</b><br>Cases per 100k people: %{x:0.1f}<BR> Deaths per 100k people: %{y:0.1f}<BR> Population (2018) %{customdata:,.0f}M<extra></extra>",
-                name=' '.join(
-                    i.split('_')))
-            traces.append(data_dict)
-        else:
-            data_dict = dict(
-                type='scatter',
-                x=list(
-                    chart_data['cases_per_cap'] *
-                    100000),
-                y=list(
-                    chart_data['deaths_per_cap'] *
-                    100000),
-                text=[
-                    ' '.join(
-                        x.split('_')) for x in chart_data['countriesAndTerritories']],
-                marker=dict(
-                    color=chart_data['colour'],
-                    size=chart_data['popData2019'],
-                    sizeref=sizeref,
-                    sizemode='area',
-                    line=dict(
-                        color='#ffffff')),
-                mode='markers',
-                customdata=chart_data['popData2019'] /
-                1000000,
-                hovertemplate="<br><b>%{text}</b><br>Cases per 100k people: %{x:0.1f}<BR> Deaths per 100k people: %{y:0.1f}<BR> Population (2018) %{customdata:,.0f}M<extra></extra>",
-                name=' '.join(
-                    i.split('_')),
-                visible='legendonly')
-            traces.append(data_dict)
-
-    except BaseException:
-        pass
-
-figure['data'] = traces
-figure['layout'] = dict(
-    title=plot_title, titlefont=dict(
-        size=title_font_size, family=title_font_family), xaxis=dict(
-            title=dict(
-                text=x_title, font=dict(
-                    size=x_title_font_size)), range=[
-                        0, 7000], ), yaxis=dict(
-                            title=dict(
-                                text=y_title, font=dict(
-                                    size=y_title_font_size)), range=[
-                                        0, 200]))
-
-
-fig4 = go.Figure(figure)
 
 # headline chart
 
-figure = {
-    'data': [],
-    'layout': {},
-    'config': {'scrollzoom': False}
-}
+def make_headline(ecdc):
+    ''' bar chart of total and latest cases and deaths for each country '''
+    data = ecdc['data']
+
+    figure = {
+        'data': [],
+        'layout': {},
+        'config': {'scrollzoom': False}
+    }
+
+    traces = []
+    bars = [
+        ('total_cases', 'Total Cases'),
+        ('total_deaths', 'Total Deaths'),
+        ('cases_weekly', 'Latest Daily Cases'),
+        ('deaths_weekly', 'Latest Daily Deaths')]
+
+    # one row per country reporting on the latest date, from the latest
+    # table, with a bar for each of its columns the table has
+    latest = ecdc['latest']
+    latest = latest[latest['dateRep'] == ecdc['latest_data']]
+    bars = [(column, name) for column, name in bars if column in latest]
+    names = [name for column, name in bars]
+    values = latest[[column for column, name in bars]].to_numpy()
+    positions = ['inside', 'outside', 'outside', 'outside'][:len(bars)]
+
+    # the weekly bars of a country whose latest week is still going are
+    # marked with the days they cover (tables without days are taken whole)
+    days = latest['days'].to_numpy() if 'days' in latest else np.full(len(latest), 7)
+
+    for country, x_values, colour, n in zip(latest['countriesAndTerritories'], values,
+                                             latest['colour'], days):
+        customdata = [country] * len(bars)
+        notes = [' ({} of 7 days)'.format(n) if column.endswith('_weekly') and n < 7 else ''
+                 for column, name in bars]
+        try:
+            if country == 'World':
+                data_dict = dict(type='bar',
+                                 y=names,
+                                 x=x_values,
+                                 customdata = customdata,
+                                 name=' '.join(country.split('_')),
+                                 text=['<b>{}</b>: {:,.0f}{}'.format(z, x, note) for x, z, note in zip(x_values, customdata, notes)],
+                                 textposition=positions,
+                                 marker=dict(color='firebrick'),
+                                 hovertemplate = "<br><b>%{customdata}</b><br>%{y}: %{x:,}<extra></extra>",
+                                 orientation='h',
+                                 )
+                traces.append(data_dict)
+
+            else:
+                data_dict = dict(type='bar',
+                                 y=names,
+                                 x=x_values,
+                                 customdata = customdata,
+                                 name=' '.join(country.split('_')),
+                                 text=['<b>{}</b>: {:,.0f}{}'.format(' '.join(z.split('_')), x, note) for x, z, note in zip(x_values, customdata, notes)],
+                                 textposition='outside',
+                                 marker=dict(color=colour),
+                                 orientation='h',
+                                 visible='legendonly',
+                                 hovertemplate = "<br><b>%{customdata}</b><br>%{y}:%{x:,}<extra></extra>",
+                                 )
+                traces.append(data_dict)
+        except BaseException:
+            pass
 
-traces = []
-names = [
-    'Total Cases',
-    'Total Deaths',
-    'Latest Daily Cases',
-    'Latest Daily Deaths']
-
-
-
-for country in data['countriesAndTerritories'].unique():
-    customdata = [country,country,country,country]
-    colour = data[data['countriesAndTerritories'] == country]['colour'].tolist()[
-        0]
-    chart_data = data[(data['dateRep'] == data['dateRep'].max()) & (
-        data['countriesAndTerritories'] == country)][['total_cases', 'total_deaths', 'cases_weekly', 'deaths_weekly']].T
-    try:
-        if country == 'World':
-            data_dict = dict(type='bar',
-                             y=names,
-                             x=chart_data.iloc[:, 0],
-                             customdata = customdata,
-                             name=' '.join(country.split('_')),
-                             text=['<b>{}</b>: {:,.0f}'.format(z, x) for x, z in zip(chart_data.iloc[:, 0], customdata)],
-                             textposition=['inside', 'outside', 'outside', 'outside'],
-                             marker=dict(color='firebrick'),
-                             hovertemplate = "<br><b>%{customdata}</b><br>%{y}: %{x:,}<extra></extra>",
-                             orientation='h',
-                             )
-            traces.append(data_dict)
- 
-        else:
-            data_dict = dict(type='bar',
-                             y=names,
-                             x=chart_data.iloc[:, 0],
-                             customdata = [country,country,country,country],
-                             name=' '.join(country.split('_')),
-                             text=['<b>{}</b>: {:,.0f}'.format(' '.join(z.split('_')), x) for x, z in zip(chart_data.iloc[:, 0], customdata)],
-                             textposition=['outside', 'outside', 'outside', 'outside'],
-                             marker=dict(color=colour),
-                             orientation='h',
-                             visible='legendonly',
-                             hovertemplate = "<br><b>%{customdata}</b><br>%{y}:%{x:,}<extra></extra>",
-                             )
-            traces.append(data_dict)
-    except BaseException:
-        pass
+    figure['data'] = traces
+    figure['layout'] = dict(
+        yaxis=dict(
+            autorange="reversed"),
+        title='<b>Headline Figures: COVID-19 Cases and Deaths</b> <BR>' + ecdc['latest_data_string']  + '<br><span style="font-size: 11px;">Source: European Centre for Disease Prevention and Control</span>',
+        titlefont=dict(
+            size=title_font_size,
+            family=title_font_family))
 
-figure['data'] = traces
-figure['layout'] = dict(
-    yaxis=dict(
-        autorange="reversed"),
-    title='<b>Headline Figures: COVID-19 Cases and Deaths</b> <BR>' + latest_data_string  + '<br><span style="font-size: 11px;">Source: European Centre for Disease Prevention and Control</span>',
-    titlefont=dict(
-        size=title_font_size,
-        family=title_font_family))
+    return go.Figure(figure)
 
-headline = go.Figure(figure)
 
 ###### excess deaths
 
+def make_fig5(econ):
+    ''' line chart of weekly expected, total and excess deaths by country,
+        and the Covid deaths the ECDC reported in the same weeks, with a menu
+        to switch to per million figures '''
+    df_chart = econ['df_chart']
+    econ_index = econ['econ_index']
+
+    figure = {
+        'data': [],
+        'config': {'scrollzoom': True}
+    }
+
+    visible_0 = []
+    visible_1 = []
+
+    for i in ['Britain']:
+        for j,k in enumerate(['expected_deaths','total_deaths','excess_deaths','reported_deaths']):
+            data_dict = dict(mode='lines',
+                         x = country_block(df_chart, econ_index, i).end_date_week,
+                         y = [None if np.isnan(n) else int(n) for n in country_block(df_chart, econ_index, i)[k]],
+                        line=dict(
+                        width=1.5
+                        ),
+                    name = '{}: {}'.format(i,' '.join(k.split('_')).capitalize()),
+                    text = [],
+                    visible=False,
+                    hovertemplate = "<br><b>{}</b><br><i>{}".format(i,' '.join(k.split('_')).capitalize())+"</i>: %{y:,}<br>Week Ending: %{x}<extra></extra>")
+
+            figure['data'].append(data_dict)
+            visible_0.append(True)
+            visible_1.append(False)
+
+
+    for i in ['Britain']:
+        for j,k in enumerate(['expected_deaths_per_mil','total_deaths_per_mil','excess_deaths_per_mil','reported_deaths_per_mil']):
+            data_dict = dict(mode='lines',
+                         x = country_block(df_chart, econ_index, i).end_date_week,
+                         y = [None if np.isnan(n) else int(n) for n in country_block(df_chart, econ_index, i)[k]],
+                        line=dict(
+                        width=1.5
+                        ),
+                    name = '{}: {}'.format(i,' '.join(k.split('_')).capitalize()),
+                    text = [],
+                    visible = True,
+                    hovertemplate = "<br><b>{}</b><br><i>{}".format(i,' '.join(k.split('_')).capitalize())+"</i>: %{y:,}<br>Week Ending: %{x}<extra></extra>")
+
+            figure['data'].append(data_dict)
+            visible_0.append(False)
+            visible_1.append(True)
+
+
+    cou =[x for x in df_chart.country.unique()]
+    cou.remove('Britain')
+    for i in cou:
+        for j,k in enumerate(['expected_deaths','total_deaths','excess_deaths','reported_deaths']):
+            data_dict = dict(mode='lines',
+                         x = country_block(df_chart, econ_index, i).end_date_week,
+                         y = [None if np.isnan(n) else int(n) for n in country_block(df_chart, econ_index, i)[k]],
+                        line=dict(
+                        width=1.5
+                        ),
+                    name = '{}: {}'.format(i,' '.join(k.split('_')).capitalize()),
+                    text = [],
+                    visible = False,
+                    hovertemplate = "<br><b>{}</b><br><i>{}".format(i,' '.join(k.split('_')).capitalize())+"</i>: %{y:,}<br>Week Ending:  %{x}<extra></extra>")
+
+            figure['data'].append(data_dict)
+            visible_0.append('legendonly')
+            visible_1.append(False)
+
+    for i in cou:
+        for j,k in enumerate(['expected_deaths_per_mil','total_deaths_per_mil','excess_deaths_per_mil','reported_deaths_per_mil']):
+            data_dict = dict(mode='lines',
+                         x = country_block(df_chart, econ_index, i).end_date_week,
+                         y = [None if np.isnan(n) else int(n) for n in country_block(df_chart, econ_index, i)[k]],
+                        line=dict(
+                        width=1.5
+                        ),
+                    name = '{}: {}'.format(i,' '.join(k.split('_')).capitalize()),
+                    text = [],
+                    visible = 'legendonly',
+                    hovertemplate = "<br><b>{}</b><br><i>{}".format(i,' '.join(k.split('_')).capitalize())+"</i>: %{y:,}<br>Week Ending:  %{x}<extra></extra>")
+
+            figure['data'].append(data_dict)
+            visible_0.append(False)
+            visible_1.append('legendonly')
+    ####
+    figure['layout'] = dict(
+        margin= dict( t=150),
+
+        title = dict(yanchor = 'top', pad = dict(b = 200, t=200)),
+        titlefont=dict(
+            size=title_font_size,
+            family=title_font_family),
+        hovermode = 'x',
+        title_text='<b>Weekly Expected Deaths, Total Deaths & Excess Deaths </b><br><span style="font-size: 12px;">Source:The Economist, reported deaths from the European Centre for Disease Prevention and Control</span><br><span style="font-size: 12px;"><i>Expected deaths are calculated as an average of 2015/16-2019, except for Spain and South Africa,<br> which are independently modelled </i> ',
+        showlegend=True,
+        yaxis=dict(
+                title=dict(
+                    text="Weekly Deaths", font=dict(
+                        size=y_title_font_size))),
+        xaxis=dict(
+                title=dict(
+                    text="Week Ending", font=dict(
+                        size=y_title_font_size))),
+
+        updatemenus = list([
+        dict(active=1,
+             showactive = False,
+             buttons=list([
+                dict(label = "Raw Numbers",
+                     method = "update",
+                     args = [{"visible": visible_0}]), # hide trace2
+                dict(label = "Per million people",
+                     method = "update",
+                     args = [{"visible": visible_1}]) # hide trace1
+                ]),
+             direction="down",
+                pad={"r": 10, "t": 10},
+                x=1.55,
+                xanchor="right",
+                y=1.2,
+                yanchor="top"
+
+            )])
+
+    )
+
+    return go.Figure(figure)
 
-df_chart = pd.read_csv('https://covid-19-app-data.s3.eu-west-2.amazonaws.com/economistdata.tsv', sep ='\t')
-df_chart['expected_deaths_per_mil'] = df_chart.expected_deaths/df_chart.population*1000000
-df_chart['excess_deaths_per_mil'] = df_chart.excess_deaths/df_chart.population*1000000
-df_chart['total_deaths_per_mil'] = df_chart.total_deaths/df_chart.population*1000000
-
-df_chart['colour'] = [colour_dict2[x] for x in df_chart['ISO']]
-
-
-figure = {
-    'data': [],
-    'config': {'scrollzoom': True}
-}
-
-visible_0 = []
-visible_1 = []
-
-for i in ['Britain']:
-    for j,k in enumerate(['expected_deaths','total_deaths','excess_deaths']):
-        data_dict = dict(mode='lines',
-                     x = df_chart[df_chart.country == i].end_date_week,
-                     y = [int(n) for n in df_chart[df_chart.country == i][k]],
-                    line=dict(
-                    width=1.5
-                    ),
-                name = '{}: {}'.format(i,' '.join(k.split('_')).capitalize()),
-                text = [],
-                visible=False,
-                hovertemplate = "<br><b>{}</b><br><i>{}".format(i,' '.join(k.split('_')).capitalize())+"</i>: %{y:,}<br>Week Ending: %{x}<extra></extra>")
-               
-        figure['data'].append(data_dict)
-        visible_0.append(True)
-        visible_1.append(False)
-
-
-for i in ['Britain']:
-    for j,k in enumerate(['expected_deaths_per_mil','total_deaths_per_mil','excess_deaths_per_mil']):
-        data_dict = dict(mode='lines',
-                     x = df_chart[df_chart.country == i].end_date_week,
-                     y = [int(n) for n in df_chart[df_chart.country == i][k]],
-                    line=dict(
-                    width=1.5
-                    ),
-                name = '{}: {}'.format(i,' '.join(k.split('_')).capitalize()),
-                text = [],
-                visible = True,
-                hovertemplate = "<br><b>{}</b><br><i>{}".format(i,' '.join(k.split('_')).capitalize())+"</i>: %{y:,}<br>Week Ending: %{x}<extra></extra>")
-               
-        figure['data'].append(data_dict)
-        visible_0.append(False)
-        visible_1.append(True)
-        
-        
-cou =[x for x in df_chart.country.unique()]
-cou.remove('Britain')
-for i in cou:
-    for j,k in enumerate(['expected_deaths','total_deaths','excess_deaths']):
-        data_dict = dict(mode='lines',
-                     x = df_chart[df_chart.country == i].end_date_week,
-                     y = [int(n) for n in df_chart[df_chart.country == i][k]],
-                    line=dict(
-                    width=1.5
-                    ),
-                name = '{}: {}'.format(i,' '.join(k.split('_')).capitalize()),
-                text = [],
-                visible = False,
-                hovertemplate = "<br><b>{}</b><br><i>{}".format(i,' '.join(k.split('_')).capitalize())+"</i>: %{y:,}<br>Week Ending:  %{x}<extra></extra>")
-               
-        figure['data'].append(data_dict)
-        visible_0.append('legendonly')
-        visible_1.append(False)
-            
-for i in cou:
-    for j,k in enumerate(['expected_deaths_per_mil','total_deaths_per_mil','excess_deaths_per_mil']):
-        data_dict = dict(mode='lines',
-                     x = df_chart[df_chart.country == i].end_date_week,
-                     y = [int(n) for n in df_chart[df_chart.country == i][k]],
-                    line=dict(
-                    width=1.5
-                    ),
-                name = '{}: {}'.format(i,' '.join(k.split('_')).capitalize()),
-                text = [],
-                visible = 'legendonly',
-                hovertemplate = "<br><b>{}</b><br><i>{}".format(i,' '.join(k.split('_')).capitalize())+"</i>: %{y:,}<br>Week Ending:  %{x}<extra></extra>")
-               
-        figure['data'].append(data_dict)
-        visible_0.append(False)
-        visible_1.append('legendonly')            
-####    
-figure['layout'] = dict(
-    margin= dict( t=150),
-
-    title = dict(yanchor = 'top', pad = dict(b = 200, t=200)),
-    titlefont=dict(
-        size=title_font_size,
-        family=title_font_family),
-    hovermode = 'x',
-    title_text='<b>Weekly Expected Deaths, Total Deaths & Excess Deaths </b><br><span style="font-size: 12px;">Source:The Economist</span><br><span style="font-size: 12px;"><i>Expected deaths are calculated as an average of 2015/16-2019, except for Spain and South Africa,<br> which are independently modelled </i> ',
-    showlegend=True,
-    yaxis=dict(
-            title=dict(
-                text="Weekly Deaths", font=dict(
-                    size=y_title_font_size))),
-    xaxis=dict(
-            title=dict(
-                text="Week Ending", font=dict(
-                    size=y_title_font_size))),
-    
-    updatemenus = list([
-    dict(active=1,
-         showactive = False,
-         buttons=list([   
-            dict(label = "Raw Numbers",
-                 method = "update",
-                 args = [{"visible": visible_0}]), # hide trace2
-            dict(label = "Per million people",
-                 method = "update",
-                 args = [{"visible": visible_1}]) # hide trace1
-            ]),
-         direction="down",
-            pad={"r": 10, "t": 10},
-            x=1.55,
-            xanchor="right",
-            y=1.2,
-            yanchor="top"
-        
-        )])
-
-)
-
-
-
-
-fig5 = go.Figure(figure)
 
 ## excess deaths v pop density
 
-week = 45
-from sklearn.linear_model import LinearRegression
-X = np.array(df_chart[df_chart.week==week]['density']).reshape(-1,1)
-y=df_chart[df_chart.week==week]['cumulative_excess_deaths_per_mil']
-reg=LinearRegression().fit(X, y)
-y_pred=reg.predict(X)
-r2 = r2_score(y,y_pred)
-print(r2)
-countries = [x for x in list(df_chart['country'].unique()) if x not in ['Istanbul (Turkey)']]
+def make_fig6(econ, week=45):
+    ''' bubble chart of cumulative excess deaths v population density at a
+        given week, with a fitted regression line '''
+    df_chart = econ['df_chart']
+    econ_index = econ['econ_index']
 
+    # the fits for every week are precomputed, weeks without enough data
+    # for a fit are swapped for the nearest week that has one
+    fits = econ['fits']
+    fits = fits[fits['n'] >= 2]
+    week = fits.index[np.abs(fits.index - week).argmin()]
+    fit = fits.loc[week]
 
-data_shown = 'First week of March up to week ending '+df_chart[df_chart.week==week].iloc[0]['end_date_week']
+    # the regression line runs across the range of densities that week
+    X = df_chart[df_chart.week==week]['density']
+    X = np.array([X.min(), X.max()])
+    y_pred = fit['intercept'] + fit['slope'] * X
+    countries = [x for x in list(df_chart['country'].unique()) if x not in ['Istanbul (Turkey)']]
 
-# define titles
-x_title = 'density(pop per sq.km)'
-y_title = 'excess deaths per million people.'
-plot_title = '<b>Cumulative excess deaths v population density </b><BR>' + data_shown + '<br><span style="font-size: 11px;">Source: World Bank and the Economist</span>'
 
+    data_shown = 'First week of March up to week ending '+df_chart[df_chart.week==week].iloc[0]['end_date_week']
 
-default_list=countries
+    # define titles
+    x_title = 'density(pop per sq.km)'
+    y_title = 'excess deaths per million people.'
+    plot_title = '<b>Cumulative excess deaths v population density </b><BR>' + data_shown + '<br><span style="font-size: 11px;">Source: World Bank and the Economist</span>'
 
-# size reference for bubbles
+    # size reference for bubbles
 
-figure = {
-    'data': [],
-    'layout': {},
-    'config': {'scrollzoom': False}
-}
+    figure = {
+        'data': [],
+        'layout': {},
+        'config': {'scrollzoom': False}
+    }
 
-traces = []
+    traces = []
 
 
-for i in countries:
-    try:
-        chart_data = df_chart.loc[df_chart['country'] == i]
-        chart_data = chart_data[chart_data['week']==week]
-#         if np.isnan(chart_data['popData2018'].tolist()[0]):
-#             pass
-        if i in default_list:
-            data_dict = dict(
-                type='scatter',
-                x=list(
-                    chart_data['density']),
-                y=list(
-                    chart_data['cumulative_excess_deaths_per_mil']),
-                text=[
-                    ' '.join(
-                        x.split('_')) for x in chart_data['country']],
-                marker=dict(
-                    color=chart_data['colour'],
-                    size=20,
-                    #sizeref=sizeref,
-                    sizemode='area',
-                    line=dict(
-                        color='#ffffff')),
-                mode='markers',
-                #customdata=chart_data['popData2018'] /
-                #1000000,
-                hovertemplate="<br><b>%{text}</b><br>Excess Deaths per million: %{y:0.0f}<extra></extra>",
-                name=' '.join(
-                    i.split('_')))
-            traces.append(data_dict)
-        else:
+    for i in countries:
+        try:
+            chart_data = country_block(df_chart, econ_index, i)
+            chart_data = chart_data[chart_data['week']==week]
             data_dict = dict(
                 type='scatter',
                 x=list(
@@ -1127,35 +911,44 @@ for i in countries:
                     i.split('_')))
             traces.append(data_dict)
 
-    except BaseException:
-        pass
-    
-reg_line = dict(type='scatter',
-                  x=df_chart[df_chart.week==week]['density'],
-                  y=y_pred,
-                  mode='lines',
-                  line=dict(color='#999999', shape='hv', dash='dot'),
-                  line_shape='linear',
-                  name='regression line',
-                  hovertemplate="<br><b>linear regression line</b>"+"<br>Increase in excess deaths per million for each additional person per sq.km: {:0.2f}<br> R-sq: {:0.2f}<extra></extra>".format(reg.coef_[0],r2))
-
-traces.append(reg_line)
-
-figure['data'] = traces
-figure['layout'] = dict(
-    title=plot_title, titlefont=dict(
-        size=title_font_size, family=title_font_family), xaxis=dict(
-            title=dict(
-                text=x_title, font=dict(
-                    size=x_title_font_size)) ),
-                    yaxis=dict(
-                            title=dict(
-                                text=y_title, font=dict(
-                                    size=y_title_font_size)), 
-                                    #range=[
-                                     #   0, 70]
-    ))
-
-
-fig6 = go.Figure(figure)
+        except BaseException:
+            pass
 
+    reg_line = dict(type='scatter',
+                      x=X,
+                      y=y_pred,
+                      mode='lines',
+                      line=dict(color='#999999', shape='hv', dash='dot'),
+                      line_shape='linear',
+                      name='regression line',
+                      hovertemplate="<br><b>linear regression line</b>"+"<br>Increase in excess deaths per million for each additional person per sq.km: {:0.2f}<br> R-sq: {:0.2f}<extra></extra>".format(fit['slope'],fit['r2']))
+
+    traces.append(reg_line)
+
+    figure['data'] = traces
+    figure['layout'] = dict(
+        title=plot_title, titlefont=dict(
+            size=title_font_size, family=title_font_family), xaxis=dict(
+                title=dict(
+                    text=x_title, font=dict(
+                        size=x_title_font_size)) ),
+                        yaxis=dict(
+                                title=dict(
+                                    text=y_title, font=dict(
+                                        size=y_title_font_size)),
+                                        #range=[
+                                         #   0, 70]
+        ))
+
+    return go.Figure(figure)
+
+
+# the dashboard's figures, each with the data it is built from
+FIGURES = {
+    'headline': ('ecdc', make_headline),
+    'fig2': ('ecdc', make_fig2),
+    'fig3': ('ecdc', make_fig3),
+    'fig4': ('ecdc', make_fig4),
+    'fig5': ('economist', make_fig5),
+    'fig6': ('economist', make_fig6),
+}
@@ -0,0 +1,160 @@
+# for data managaement
+import io
+import os
+import json
+import time
+import hashlib
+import tempfile
+import threading
+
+# for fetching data
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3 import HTTPResponse
+
+
+# what happens to GET requests made through sessions from this module:
+# 'passthrough' sends them as normal, 'record' serves them from the cache
+# while it is fresh and otherwise fetches and records them, 'replay' only
+# ever serves from the cache, so runs work offline on the same inputs
+MODE = os.environ.get('HTTP_CACHE', 'passthrough')
+CACHE_DIR = os.environ.get('HTTP_CACHE_DIR', 'http_cache')
+
+# seconds a recorded response stays fresh in record mode, by host
+TTLS = {
+    'opendata.ecdc.europa.eu': 6 * 60 * 60,
+    'github.com': 24 * 60 * 60,
+    'raw.githubusercontent.com': 24 * 60 * 60,
+    'api.worldbank.org': 30 * 24 * 60 * 60,
+    'covid-19-app-data.s3.eu-west-2.amazonaws.com': 60 * 60,
+}
+DEFAULT_TTL = 60 * 60
+
+
+class CachingAdapter(HTTPAdapter):
+    ''' a transport adapter that records GET responses and plays them back
+        Bodies are kept as sent (still compressed if they were) under the
+        sha256 of their content, so repeated bodies are stored once, and an
+        index maps each url to its body, status and headers '''
+
+    def __init__(self, mode=MODE, cache_dir=CACHE_DIR, ttls=TTLS, **kwargs):
+        super().__init__(**kwargs)
+        self.mode = mode
+        self.cache_dir = cache_dir
+        self.ttls = ttls
+        self.lock = threading.Lock()
+
+    def send(self, request, **kwargs):
+        if self.mode == 'passthrough' or request.method != 'GET':
+            return super().send(request, **kwargs)
+
+        entry = self.lookup(request.url)
+        if entry is not None and (self.mode == 'replay' or self.fresh(request.url, entry)):
+            return self.replay(request, entry)
+        if self.mode == 'replay':
+            raise requests.ConnectionError(
+                'no recorded response for {} (HTTP_CACHE=replay)'.format(request.url),
+                request=request)
+
+        # conditional headers are dropped so a full body is recorded
+        request.headers.pop('If-None-Match', None)
+        request.headers.pop('If-Modified-Since', None)
+        kwargs['stream'] = True
+        response = super().send(request, **kwargs)
+        if response.status_code != 200:
+            return response
+        entry = self.record(request.url, response)
+        return self.replay(request, entry)
+
+    def ttl(self, url):
+        return self.ttls.get(requests.utils.urlparse(url).hostname, DEFAULT_TTL)
+
+    def fresh(self, url, entry):
+        return time.time() - entry['recorded'] < self.ttl(url)
+
+    def index_path(self):
+        return os.path.join(self.cache_dir, 'index.json')
+
+    def body_path(self, digest):
+        return os.path.join(self.cache_dir, 'objects', digest)
+
+    def read_index(self):
+        try:
+            with open(self.index_path()) as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return {}
+
+    def lookup(self, url):
+        with self.lock:
+            return self.read_index().get(url)
+
+    def record(self, url, response):
+        ''' streams the body to a file as it is hashed, so a large body is
+            never held in memory, then files it under its hash '''
+        objects = os.path.dirname(self.body_path(''))
+        os.makedirs(objects, exist_ok=True)
+        fd, part = tempfile.mkstemp(dir=objects, suffix='.part')
+        digest = hashlib.sha256()
+        with os.fdopen(fd, 'wb') as f:
+            for chunk in response.raw.stream(1 << 20, decode_content=False):
+                digest.update(chunk)
+                f.write(chunk)
+        response.close()
+
+        digest = digest.hexdigest()
+        entry = dict(digest=digest, status=response.status_code,
+                     headers=dict(response.headers), recorded=time.time())
+        with self.lock:
+            path = self.body_path(digest)
+            if os.path.exists(path):
+                os.remove(part)
+            else:
+                os.replace(part, path)
+
+            index = self.read_index()
+            index[url] = entry
+            with open(self.index_path() + '.part', 'w') as f:
+                json.dump(index, f)
+            os.replace(self.index_path() + '.part', self.index_path())
+        return entry
+
+    def replay(self, request, entry):
+        ''' builds a response from a recorded entry, reading the body from
+            its file as the response is read. A conditional request whose
+            ETag matches gets a 304, as the server would send '''
+        headers = {k: v for k, v in entry['headers'].items()
+                   if k.lower() != 'transfer-encoding'}
+        etag = request.headers.get('If-None-Match')
+        if etag is not None and etag == headers.get('ETag'):
+            status, body = 304, io.BytesIO(b'')
+        else:
+            status, body = entry['status'], open(self.body_path(entry['digest']), 'rb')
+        raw = HTTPResponse(body=body, headers=headers,
+                           status=status, preload_content=False)
+        return self.build_response(request, raw)
+
+
+def mount(session, **kwargs):
+    ''' mounts a caching adapter on a session, keyword arguments are passed
+        to the adapter (and on to HTTPAdapter) '''
+    adapter = CachingAdapter(**kwargs)
+    session.mount('https://', adapter)
+    session.mount('http://', adapter)
+    return session
+
+
+def session(**kwargs):
+    ''' a requests session whose GETs go through the cache '''
+    return mount(requests.Session(), **kwargs)
+
+
+_session = None
+
+
+def get(url, **kwargs):
+    ''' requests.get through one shared caching session '''
+    global _session
+    if _session is None:
+        _session = session()
+    return _session.get(url, **kwargs)
@@ -0,0 +1,46 @@
+# for data managaement
+import numpy as np
+import pandas as pd
+
+# colours
+from palettable.tableau import Tableau_20
+
+
+# columns carried into the latest table, where the data has them
+LATEST_COLUMNS = ['countriesAndTerritories', 'dateRep', 'days', 'country_key',
+                  'Continent_Name', 'popData2019', 'total_cases',
+                  'total_deaths', 'cases_weekly', 'deaths_weekly',
+                  'cases_per_cap', 'deaths_per_cap', 'colour']
+
+
+def country_colours(data):
+    ''' hands out the palette's colours to countries, cycling through it
+        Countries are sorted by cases first, so hopefully countries with
+        similar numbers of cases end up with different colours
+        returns the colour of each row of data (which must have a default
+        index) and a dict of colours keyed by the registry's country key '''
+    order = data.sort_values(
+        by=['total_cases', 'countriesAndTerritories', 'dateRep'], ascending=True).index.to_numpy()
+
+    # colours are handed out by integer code, in the order countries first
+    # appear in order
+    codes, names = pd.factorize(data['countriesAndTerritories'])
+    colour_list = np.empty(len(names), dtype=object)
+    colour_list[pd.unique(codes[order])] = np.resize(Tableau_20.hex_colors, len(names))
+
+    # and separately by country key, for the excess deaths charts (leaving
+    # out -1, the key of every country the registry does not know)
+    keys = pd.unique(data['country_key'].to_numpy()[order])
+    keys = keys[keys >= 0]
+    colour_dict2 = dict(zip(keys, np.resize(Tableau_20.hex_colors, len(keys))))
+
+    return colour_list[codes], colour_dict2
+
+
+def build_latest(data, country_index):
+    ''' one row per country: its most recent report, with its totals, weekly
+        and per capita figures and colour. data must be sorted by country
+        and date (and coloured), country_index is its build_country_index '''
+    last_rows = np.array([stop - 1 for start, stop in country_index.values()], dtype=int)
+    columns = [c for c in LATEST_COLUMNS if c in data]
+    return data[columns].iloc[last_rows].reset_index(drop=True)
@@ -0,0 +1,90 @@
+# for data managaement
+import os
+import json
+import warnings
+import numpy as np
+import pandas as pd
+
+from snapshot import download
+
+
+# the ECDC metrics at the weekly grain are also published as dense dates x
+# countries arrays, ECDCdata_matrix/<metric>.npy, with
+# ECDCdata_matrix/axes.json holding the sorted date (each week's Monday, so
+# a country whose week ends early shares the row) and country labels. A
+# country's series is then a column and a week's cross-section a row
+MATRIX_DIR = 'ECDCdata_matrix'
+MATRIX_AXES = MATRIX_DIR + '/axes.json'
+
+METRICS = ['cases_weekly', 'deaths_weekly', 'total_cases', 'total_deaths',
+           'cases_per_cap', 'deaths_per_cap', 'popData2019']
+
+
+def build_matrices(data, metrics=METRICS, country='countriesAndTerritories',
+                   date='dateRep'):
+    ''' spreads each metric in data (long format, one row per country and
+        date) into a dates x countries float array, NaN where a country has
+        no row for a date. Metrics missing from data are skipped, with a
+        warning
+        returns a dict of dates, countries and values (metric -> array) '''
+    date_codes, dates = pd.factorize(data[date], sort=True)
+    country_codes, countries = pd.factorize(data[country], sort=True)
+
+    values = {}
+    for metric in metrics:
+        if metric not in data:
+            warnings.warn('{} is not in the data, no matrix is made for it'.format(metric))
+            continue
+        values[metric] = np.full((len(dates), len(countries)), np.nan)
+        values[metric][date_codes, country_codes] = data[metric].to_numpy(dtype=float)
+
+    return dict(dates=pd.DatetimeIndex(dates), countries=pd.Index(countries),
+                values=values)
+
+
+def write_matrices(matrices, out_dir=''):
+    ''' writes each metric as a .npy file, then the axes, and returns the
+        paths written in the order to publish them '''
+    paths = []
+    for metric, values in matrices['values'].items():
+        path = os.path.join(out_dir, MATRIX_DIR, metric + '.npy')
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        np.save(path, values)
+        paths.append(path)
+
+    # the axes go last, so they never name metrics that are not there
+    path = os.path.join(out_dir, MATRIX_AXES)
+    with open(path, 'w') as f:
+        json.dump(dict(dates=[d.isoformat() for d in matrices['dates']],
+                       countries=list(matrices['countries']),
+                       metrics=list(matrices['values'])), f)
+    paths.append(path)
+    return paths
+
+
+def load_matrices(metrics=None):
+    ''' fetches the published arrays for metrics (default all of them) and
+        memory maps them, returned in the same form as build_matrices
+        Metrics that were not published are left out '''
+    path, changed = download(MATRIX_AXES)
+    with open(path) as f:
+        axes = json.load(f)
+
+    values = {}
+    for metric in [m for m in metrics or axes['metrics'] if m in axes['metrics']]:
+        path, changed = download('{}/{}.npy'.format(MATRIX_DIR, metric))
+        values[metric] = np.load(path, mmap_mode='r')
+
+    return dict(dates=pd.DatetimeIndex(axes['dates']),
+                countries=pd.Index(axes['countries']), values=values)
+
+
+def series(matrices, metric, country):
+    ''' a country's values for metric, one per date '''
+    return matrices['values'][metric][:, matrices['countries'].get_loc(country)]
+
+
+def cross_section(matrices, metric, date=None):
+    ''' every country's value for metric on date (default the latest) '''
+    row = -1 if date is None else matrices['dates'].get_loc(date)
+    return matrices['values'][metric][row]
@@ -0,0 +1,119 @@
+# for data managaement
+import os
+import json
+import hashlib
+import pandas as pd
+
+# typed columnar snapshots (Arrow IPC / feather)
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.feather as feather
+
+from snapshot import write_snapshot, download
+
+
+# the ECDC snapshot is also published split by continent, as
+# ECDCdata/<continent>.feather, with ECDCdata/index.json listing what is in
+# each part so a loader only fetches the parts it needs
+PARTITION_DIR = 'ECDCdata'
+PARTITION_INDEX = PARTITION_DIR + '/index.json'
+
+# rows with no continent (the world aggregate) go in their own part
+OTHER = 'Other'
+
+
+def partition_key(continent):
+    ''' the file name, without extension, of a continent's part '''
+    return str(continent).lower().replace(' ', '_')
+
+
+def write_partitions(data, by='Continent_Name', country='countriesAndTerritories',
+                     date='dateRep', out_dir=''):
+    ''' writes one snapshot per value of by, then the index describing them,
+        and returns the paths written in the order to publish them
+        data must be sorted by country and date, each part keeps that order '''
+    groups = data[by].fillna(OTHER)
+    parts = []
+    paths = []
+    for continent in sorted(groups.unique()):
+        part = data[(groups == continent).to_numpy()]
+        path = os.path.join(out_dir, PARTITION_DIR, partition_key(continent) + '.feather')
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        write_snapshot(part, path)
+        with open(path, 'rb') as f:
+            digest = hashlib.sha256(f.read()).hexdigest()[:16]
+        parts.append(dict(key=partition_key(continent), continent=continent,
+                          countries=list(pd.unique(part[country])),
+                          start=part[date].min().isoformat(),
+                          end=part[date].max().isoformat(),
+                          rows=len(part), digest=digest))
+        paths.append(path)
+
+    # the index goes last, so it never names parts that are not there
+    path = os.path.join(out_dir, PARTITION_INDEX)
+    with open(path, 'w') as f:
+        json.dump(dict(country=country, date=date, columns=list(data.columns),
+                       partitions=parts), f)
+    paths.append(path)
+    return paths
+
+
+def read_partition_index():
+    ''' returns the published partition index '''
+    path, changed = download(PARTITION_INDEX)
+    with open(path) as f:
+        return json.load(f)
+
+
+def select_partitions(index, countries=None, start=None, end=None):
+    ''' returns the index entries that may hold rows for any of countries
+        between start and end (all of them when these are None) '''
+    selected = []
+    for part in index['partitions']:
+        if countries is not None and not set(countries) & set(part['countries']):
+            continue
+        if start is not None and pd.Timestamp(part['end']) < pd.Timestamp(start):
+            continue
+        if end is not None and pd.Timestamp(part['start']) > pd.Timestamp(end):
+            continue
+        selected.append(part)
+    return selected
+
+
+def load_partitions(countries=None, start=None, end=None, columns=None):
+    ''' reads the ECDC data from its partitioned snapshot, fetching only the
+        parts that can match and reading only the columns asked for
+        countries is a list of names, start and end bound the dates
+        (inclusive) and columns defaults to every column. Rows come back
+        sorted by country and date within each continent '''
+    index = read_partition_index()
+    country, date = index['country'], index['date']
+
+    # the filter columns are read too, and dropped again afterwards
+    read_columns = None
+    if columns is not None:
+        read_columns = list(dict.fromkeys(list(columns) + [country, date]))
+
+    tables = []
+    for part in select_partitions(index, countries, start, end):
+        path, changed = download('{}/{}.feather'.format(PARTITION_DIR, part['key']))
+        table = feather.read_table(path, columns=read_columns, memory_map=True)
+
+        mask = None
+        if countries is not None:
+            mask = pc.is_in(table[country], value_set=pa.array(list(countries)))
+        if start is not None:
+            after = pc.greater_equal(table[date], pa.scalar(pd.Timestamp(start), table.schema.field(date).type))
+            mask = after if mask is None else pc.and_(mask, after)
+        if end is not None:
+            before = pc.less_equal(table[date], pa.scalar(pd.Timestamp(end), table.schema.field(date).type))
+            mask = before if mask is None else pc.and_(mask, before)
+        tables.append(table if mask is None else table.filter(mask))
+
+    if not tables:
+        return pd.DataFrame(columns=columns if columns is not None else index['columns'])
+
+    data = pa.concat_tables(tables).to_pandas()
+    if columns is not None:
+        data = data[list(columns)]
+    return data
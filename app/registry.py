@@ -0,0 +1,231 @@
+# for building figures off the request path
+import os
+import threading
+import time
+
+import snapshot
+from snapshot import download
+from artifacts import DATA_FILES, data_version, read_manifest, read_figure
+
+# 'artifacts' serves the figures prebuilt by data_creation/figuredata.py,
+# 'build' builds them here from the data
+FIGURE_SOURCE = os.environ.get('FIGURE_SOURCE', 'artifacts')
+
+# the dashboard's figures, see figures.FIGURES. figures.py (and pandas) is
+# only imported when a figure has to be built rather than read
+FIGURE_NAMES = ['headline', 'fig2', 'fig3', 'fig4', 'fig5', 'fig6']
+
+# seconds between checks for new data
+REFRESH_INTERVAL = int(os.environ.get('REFRESH_INTERVAL', 3600))
+
+# how many versions are kept, so a page that loaded the previous version can
+# still be served from it while the next one is swapped in
+KEEP_VERSIONS = 2
+
+
+def new_snapshot(version, manifest=None):
+    ''' makes an empty snapshot: one version of the data and the figures
+        built from it (and, in artifacts mode, the manifest of the figures
+        prebuilt from it). Once its data is loaded a snapshot is never
+        changed, only filled in with figures built from that data '''
+    return dict(version=version, data={}, figures={}, manifest=manifest,
+                lock=threading.RLock())
+
+
+# the snapshot being served (None until the data is first checked), and
+# recent ones by version, oldest first. Swapping _current is a single
+# assignment, so readers always get one whole snapshot
+_current = None
+_snapshots = {}
+_swap_lock = threading.Lock()
+
+# seconds the last warm up took, to compare start up between settings
+_warm_up_seconds = None
+
+
+def source_version():
+    ''' returns the version of the published data and, in artifacts mode,
+        the manifest of the figures prebuilt from it. Versions are made from
+        the data itself (see artifacts.data_version), so every worker
+        process names the same data the same way: the manifest's version,
+        or the data files' own when there are no artifacts to serve '''
+    if FIGURE_SOURCE == 'artifacts':
+        try:
+            manifest = read_manifest()
+            return manifest['version'], manifest
+        except Exception:
+            pass
+    return data_version([download(name)[0] for name in DATA_FILES]), None
+
+
+def current_version():
+    ''' returns the version of the snapshot being served '''
+    return get_snapshot()['version']
+
+
+def get_snapshot(version=None):
+    ''' returns the snapshot for a version, or the current one if the version
+        is not given or no longer kept. A version this process does not have
+        may have been swapped in by another worker first, so the data is
+        checked for it before falling back to the current snapshot '''
+    if version in _snapshots:
+        return _snapshots[version]
+    if _current is None or version is not None:
+        try:
+            refresh()
+        except Exception:
+            if _current is None:
+                raise
+    return _snapshots.get(version, _current)
+
+
+def get_data(name, version=None):
+    ''' returns the 'ecdc', 'economist' or 'cube' data, loading it on first
+        use '''
+    snapshot = get_snapshot(version)
+    if name in snapshot['data']:
+        return snapshot['data'][name]
+
+    with snapshot['lock']:
+        if name not in snapshot['data']:
+            import figures
+            if name == 'ecdc':
+                data = figures.load_ecdc()
+            elif name == 'cube':
+                data = figures.load_cube()
+            else:
+                data = figures.load_economist(
+                    get_data('ecdc', snapshot['version']))
+            check_pinned(snapshot)
+            snapshot['data'][name] = data
+        return snapshot['data'][name]
+
+
+def check_pinned(snapshot):
+    ''' a snapshot serves one version of the data (and, in artifacts mode,
+        the figures prebuilt from it), and figures built here (e.g. for
+        another threshold) must come from that same version rather than
+        whatever has been published since. Raises ValueError if the data
+        files just loaded are not the snapshot's version '''
+    version = data_version([download(name)[0] for name in DATA_FILES])
+    if version != snapshot['version']:
+        raise ValueError('the published data is version {}, not the {} this '
+                         'snapshot serves'.format(version, snapshot['version']))
+
+
+def get_figure(name, version=None):
+    ''' returns one of the dashboard's figures, building it on first use '''
+    snapshot = get_snapshot(version)
+
+    # cached figures are served without waiting on builds in progress
+    if name in snapshot['figures']:
+        return snapshot['figures'][name]
+
+    with snapshot['lock']:
+        if name not in snapshot['figures']:
+            snapshot['figures'][name] = load_figure(name, snapshot)
+        return snapshot['figures'][name]
+
+
+def load_figure(name, snapshot):
+    ''' reads a prebuilt figure for a snapshot, falling back to building it
+        from the data if there are no artifacts to read '''
+    if snapshot['manifest'] is not None:
+        try:
+            return read_figure(snapshot['manifest']['version'], name)
+        except Exception:
+            pass
+
+    return build_figure(name, snapshot['version'])
+
+
+def build_figure(name, version=None, *args):
+    ''' builds a figure from the data, passing any extra arguments (such as
+        the log charts' threshold) to its builder '''
+    import figures
+    source, builder = figures.FIGURES[name]
+    return builder(get_data(source, version), *args)
+
+
+def warm_up(version=None):
+    ''' builds every figure, meant to be run in a background thread once
+        the server is up. A figure that fails is left to be built (and to
+        raise) on its first request '''
+    global _warm_up_seconds
+    start = time.perf_counter()
+    for name in FIGURE_NAMES:
+        try:
+            get_figure(name, version)
+        except Exception:
+            pass
+    _warm_up_seconds = time.perf_counter() - start
+
+
+def start_warm_up():
+    ''' starts warm_up in a daemon thread and returns the thread '''
+    thread = threading.Thread(target=warm_up, name='figure-warm-up', daemon=True)
+    thread.start()
+    return thread
+
+
+def status():
+    ''' reports which figures of the current snapshot have been built '''
+    snapshot = _current
+    return {name: snapshot is not None and name in snapshot['figures']
+            for name in FIGURE_NAMES}
+
+
+def transport():
+    ''' reports how the published files were fetched: the encoding, bytes
+        transferred and seconds taken for each, and how long warm up took '''
+    return dict(encoding=snapshot.ENCODING, files=dict(snapshot.TRANSFERS),
+                warm_up_seconds=_warm_up_seconds)
+
+
+def refresh():
+    ''' checks the published data's version, using conditional GETs. If it
+        is not the version being served, a new snapshot is built in full and
+        then swapped in (the first is swapped in straight away, and built by
+        warm_up). Returns True if a new snapshot was swapped in '''
+    global _current
+
+    with _swap_lock:
+        version, manifest = source_version()
+        if _current is not None and version == _current['version']:
+            return False
+
+        snapshot = _snapshots.pop(version, None) or new_snapshot(version, manifest)
+        _snapshots[version] = snapshot
+
+        # build everything before anyone is pointed at the new snapshot
+        if _current is not None:
+            try:
+                for name in FIGURE_NAMES:
+                    get_figure(name, version)
+            except Exception:
+                del _snapshots[version]
+                raise
+
+        _current = snapshot
+        for old in list(_snapshots)[:-KEEP_VERSIONS]:
+            del _snapshots[old]
+    return True
+
+
+def refresh_forever(interval=REFRESH_INTERVAL):
+    ''' runs refresh every interval seconds. A failed refresh leaves the
+        current snapshot in place and is tried again next time '''
+    while True:
+        time.sleep(interval)
+        try:
+            refresh()
+        except Exception:
+            pass
+
+
+def start_refresher(interval=REFRESH_INTERVAL):
+    ''' starts refresh_forever in a daemon thread and returns the thread '''
+    thread = threading.Thread(target=refresh_forever, args=(interval,),
+                              name='data-refresher', daemon=True)
+    thread.start()
+    return thread
@@ -0,0 +1,40 @@
+# for data managaement
+import numpy as np
+import pandas as pd
+
+
+def fit_by_group(x, y, groups):
+    ''' fits y = intercept + slope * x by least squares separately for every
+        group, all groups at once, using the closed form built from per-group
+        sums. Rows where x or y is missing are left out
+        returns a dataframe indexed by group with slope, intercept, r2 and n '''
+    x = np.asarray(x, dtype=float)
+    y = np.asarray(y, dtype=float)
+    keep = ~(np.isnan(x) | np.isnan(y))
+    codes, labels = pd.factorize(np.asarray(groups)[keep], sort=True)
+    x, y = x[keep], y[keep]
+
+    def total(values):
+        return np.bincount(codes, weights=values, minlength=len(labels))
+
+    n = total(np.ones_like(x))
+    mean_x = total(x) / n
+    mean_y = total(y) / n
+
+    # centred sums, which are better conditioned than the raw ones
+    dx = x - mean_x[codes]
+    dy = y - mean_y[codes]
+    sxx = total(dx * dx)
+    sxy = total(dx * dy)
+    syy = total(dy * dy)
+
+    with np.errstate(divide='ignore', invalid='ignore'):
+        slope = sxy / sxx
+        intercept = mean_y - slope * mean_x
+        # for a least squares line the residual sum of squares is
+        # syy - slope * sxy
+        r2 = 1 - (syy - slope * sxy) / syy
+
+    return pd.DataFrame({'slope': slope, 'intercept': intercept,
+                         'r2': r2, 'n': n.astype(int)},
+                        index=pd.Index(labels, name='group'))
@@ -0,0 +1,130 @@
+# for data managaement
+import numpy as np
+import pandas as pd
+
+
+# the grains series can be converted between. Weeks are ISO weeks, Monday
+# to Sunday, labelled by ISO year and week number
+GRAINS = ['daily', 'weekly']
+
+# how the ECDC columns resample: flows (counts in a period) are summed into
+# weeks, as <column>_weekly like the ECDC's own weekly feed, and spread
+# evenly over the days reported. Stocks (running totals, rates) take the
+# week's last value and are repeated over its days
+ECDC_SUMS = ['cases', 'deaths']
+ECDC_LASTS = ['total_cases', 'total_deaths', 'cases_per_cap',
+              'deaths_per_cap', 'popData2019']
+
+
+def week_starts(dates):
+    ''' the Monday of each date's ISO week, missing dates stay missing '''
+    dates = pd.DatetimeIndex(dates)
+    return dates.normalize() - pd.to_timedelta(dates.weekday, unit='D')
+
+
+def iso_weeks(dates):
+    ''' the ISO year, week number and Monday of each date '''
+    dates = pd.DatetimeIndex(dates)
+    calendar = dates.isocalendar()
+    return pd.DataFrame({'year': calendar['year'].to_numpy(dtype=int),
+                         'week': calendar['week'].to_numpy(dtype=int),
+                         'week_start': week_starts(dates)})
+
+
+def to_weekly(data, sums=ECDC_SUMS, lasts=ECDC_LASTS, key='countriesAndTerritories',
+              date='dateRep'):
+    ''' turns daily rows into one row per key and ISO week, in one grouped
+        pass. Columns in sums are summed over the week into <column>_weekly,
+        columns in lasts take the value on the week's last reported day
+        days counts the days reported, so partial weeks can be told apart
+        returns key, year, week, week_start, the week's last date as date,
+        days, then the columns, sorted by key and week '''
+    sums = [c for c in sums if c in data]
+    lasts = [c for c in lasts if c in data]
+
+    weeks = iso_weeks(data[date])
+    frame = pd.concat([data[[key, date] + sums + lasts].reset_index(drop=True), weeks], axis=1)
+    frame.sort_values(by=[key, date], inplace=True, kind='mergesort')
+
+    weekly = frame.groupby(by=[key, 'week_start'], sort=True).agg(
+        year=('year', 'last'), week=('week', 'last'), **{date: (date, 'last')},
+        days=(date, 'count'),
+        **{c + '_weekly': (c, 'sum') for c in sums},
+        **{c: (c, 'last') for c in lasts})
+    return weekly.reset_index()
+
+
+def to_daily(weekly, sums=ECDC_SUMS, lasts=ECDC_LASTS, key='countriesAndTerritories',
+             date='dateRep'):
+    ''' turns one row per key and ISO week into one row per day, by repeating
+        rows rather than looping. The <column>_weekly of each of sums is
+        spread evenly over the week's days as <column>, columns in lasts are
+        repeated
+        weeks made by to_weekly count the days reported, and are spread over
+        that many days up to the week's last date, so a partial week at
+        either end of a series stays inside the dates it came from. Weeks
+        from the ECDC's own feed are labelled by date only and cover the
+        seven days from their Monday '''
+    sums = [c for c in sums if c + '_weekly' in weekly]
+    lasts = [c for c in lasts if c in weekly]
+
+    if 'days' in weekly:
+        counts = weekly['days'].to_numpy(dtype=np.int64)
+        ends = pd.DatetimeIndex(weekly[date]).normalize().to_numpy()
+        starts = ends - (counts - 1).astype('timedelta64[D]')
+    else:
+        counts = np.full(len(weekly), 7, dtype=np.int64)
+        starts = week_starts(weekly[date]).to_numpy()
+
+    # the row of weekly each day comes from, and the day's place in its week
+    rows = np.repeat(np.arange(len(weekly)), counts)
+    days = np.arange(len(rows)) - np.repeat(np.cumsum(counts) - counts, counts)
+
+    daily = pd.DataFrame({key: weekly[key].to_numpy()[rows],
+                          date: starts[rows] + days.astype('timedelta64[D]')})
+    for c in sums:
+        daily[c] = weekly[c + '_weekly'].to_numpy(dtype=float)[rows] / counts[rows]
+    for c in lasts:
+        daily[c] = weekly[c].to_numpy()[rows]
+    return daily
+
+
+def at_grain(grains, grain, sums=ECDC_SUMS, lasts=ECDC_LASTS,
+             key='countriesAndTerritories', date='dateRep'):
+    ''' returns the data at a grain from grains, a dict of grain -> frame
+        holding at least the data's own grain. Other grains are made from it
+        on first use and kept in the dict, so each is only made once '''
+    if grain not in GRAINS:
+        raise ValueError('unknown grain {}, expected one of {}'.format(grain, GRAINS))
+    if grain not in grains:
+        if grain == 'weekly':
+            grains[grain] = to_weekly(grains['daily'], sums, lasts, key, date)
+        else:
+            grains[grain] = to_daily(grains['weekly'], sums, lasts, key, date)
+    return grains[grain]
+
+
+def sum_to_weeks(daily, weeks, column, key='country_key', date='dateRep',
+                 end='end_date_week'):
+    ''' sums a daily column over weeks that need not be ISO weeks, such as
+        weeks ending on a Friday. weeks holds a key and each week's end date,
+        and a week takes the seven days up to and including its end. Weeks
+        the daily data does not have all seven days of are left missing
+        returns the sums in the order of weeks '''
+    if daily.empty:
+        return np.full(len(weeks), np.nan)
+    days = daily[[key, date, column]].sort_values(by=date, kind='mergesort')
+    ends = weeks[[key, end]].drop_duplicates().dropna().sort_values(by=end, kind='mergesort')
+    # the join needs the keys and dates stored alike on both sides
+    ends = ends.astype({key: days[key].dtype, end: days[date].dtype})
+
+    # each day goes to the first of its key's weeks ending on or after it,
+    # if that week has started by then
+    days = pd.merge_asof(days, ends, left_on=date, right_on=end, by=key,
+                         direction='forward')
+    days = days[(days[end] - days[date]) < pd.Timedelta(days=7)]
+
+    sums = days.groupby(by=[key, end]).agg(total=(column, 'sum'), days=(column, 'count'))
+    sums.loc[sums['days'] < 7, 'total'] = np.nan
+    return pd.merge(weeks[[key, end]], sums['total'].reset_index(),
+                    on=[key, end], how='left')['total'].to_numpy()
@@ -0,0 +1,198 @@
+# for data managaement
+import io
+import os
+import gzip
+import json
+import time
+import tempfile
+import threading
+
+# typed columnar snapshots (Arrow IPC / feather)
+import pyarrow.feather as feather
+
+# where the ETL publishes its outputs
+from storage import get_storage, compress, ENCODINGS
+
+
+# where the app keeps local copies of published files
+CACHE_DIR = os.environ.get('SNAPSHOT_CACHE_DIR', 'data_cache')
+
+# how published files are fetched: 'gzip', 'zstd' or 'none'. The ETL
+# publishes each file as is and in every encoding in PUBLISH_ENCODINGS, so
+# the app can be switched between them to compare start up times
+ENCODING = os.environ.get('SNAPSHOT_ENCODING', 'gzip')
+PUBLISH_ENCODINGS = os.environ.get('SNAPSHOT_PUBLISH_ENCODINGS', 'gzip').split(',')
+
+# bytes transferred and seconds taken by the last download of each file
+TRANSFERS = {}
+
+
+def write_snapshot(df, path):
+    ''' writes a dataframe to an Arrow IPC (feather) file
+        dtypes and datetimes are kept, and the file is left uncompressed
+        so that readers can memory map it rather than parse it
+        the file is written next to path and then moved over it, so a
+        snapshot being read (even memory mapped, as when df came from it)
+        is never written over in place '''
+    part = path + '.part'
+    try:
+        feather.write_feather(df.reset_index(drop=True), part,
+                              compression='uncompressed')
+        os.replace(part, path)
+    except BaseException:
+        os.remove(part)
+        raise
+    return path
+
+
+def read_snapshot(path, columns=None):
+    ''' reads a snapshot written by write_snapshot, memory mapping the file
+        takes an optional list of columns to load '''
+    table = feather.read_table(path, columns=columns, memory_map=True)
+    return table.to_pandas()
+
+
+def publish(path, storage=None, encodings=PUBLISH_ENCODINGS):
+    ''' uploads a file as is and compressed in each of encodings, under its
+        path plus the encoding's suffix '''
+    storage = storage or get_storage()
+    storage.upload(path)
+    for encoding in encodings:
+        if encoding in ENCODINGS:
+            compressed = compress(path, encoding)
+            storage.upload(compressed, encoding=encoding)
+            os.remove(compressed)
+
+
+class Tee(io.RawIOBase):
+    ''' a writable file that writes everything to several others '''
+
+    def __init__(self, sinks):
+        self.sinks = sinks
+
+    def writable(self):
+        return True
+
+    def write(self, b):
+        for sink in self.sinks:
+            sink.write(b)
+        return len(b)
+
+
+def compressor(encoding, upload):
+    ''' wraps an upload so what is written to it is compressed first,
+        closing the wrapper ends the stream but leaves the upload open '''
+    if encoding == 'gzip':
+        return gzip.GzipFile(fileobj=upload, mode='wb', mtime=0)
+    import zstandard
+    return zstandard.ZstdCompressor(level=10).stream_writer(upload, closefd=False)
+
+
+def publish_stream(name, write, storage=None, encodings=PUBLISH_ENCODINGS):
+    ''' publishes a file without writing it to disk first. write is called
+        with a binary file to serialize into, and what it writes is streamed
+        into an upload of name and one of each compressed copy, so
+        serialization, compression and the upload all overlap
+        If write fails every upload is aborted, so nothing half written is
+        published '''
+    storage = storage or get_storage()
+    uploads = [storage.open_upload(name)]
+    sinks = [uploads[0]]
+    for encoding in encodings:
+        if encoding in ENCODINGS:
+            upload = storage.open_upload(name + ENCODINGS[encoding], encoding)
+            uploads.append(upload)
+            sinks.append(compressor(encoding, upload))
+
+    try:
+        write(Tee(sinks))
+        for sink in sinks[1:]:
+            sink.close()
+        for upload in uploads:
+            upload.close()
+    except Exception:
+        for upload in uploads:
+            if not upload.closed:
+                upload.abort()
+        raise
+
+
+def csv_writer(df, **kwargs):
+    ''' returns a write function for publish_stream that writes df with
+        to_csv, taking the same keyword arguments '''
+    encoding = kwargs.pop('encoding', 'UTF-8')
+
+    def write(f):
+        text = io.TextIOWrapper(f, encoding=encoding, newline='')
+        df.to_csv(text, **kwargs)
+        text.flush()
+        text.detach()
+    return write
+
+
+def download(name, cache_dir=CACHE_DIR, encoding=ENCODING):
+    ''' downloads a published file into the local cache, returning its
+        path and whether it changed. With an encoding the compressed copy
+        is fetched and decompressed as it streams in. What the storage
+        backend reported for the last download (e.g. the ETag and
+        Last-Modified headers) is kept next to the file and sent back, so
+        an unchanged file is not downloaded again. The download goes to a
+        temporary file of its own first so a half written file is never
+        read, and downloads of the same file from several threads take
+        turns, so each sees the copy and headers the last one left '''
+    path = os.path.join(cache_dir, name)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    meta_path = path + '.meta'
+
+    with _download_lock(path):
+        meta = None
+        if os.path.exists(path) and os.path.exists(meta_path):
+            with open(meta_path) as f:
+                meta = json.load(f)
+
+        # the cached copy is only current if it came in the same encoding
+        if meta and meta.get('encoding') != encoding:
+            meta = None
+
+        start = time.perf_counter()
+        key = name + ENCODINGS.get(encoding, '')
+        fd, part = tempfile.mkstemp(dir=os.path.dirname(path), suffix='.part')
+        os.close(fd)
+        try:
+            meta = get_storage().download(key, part, meta,
+                                          encoding if encoding in ENCODINGS else None)
+            if meta is None:
+                os.remove(part)
+                return path, False
+
+            meta['encoding'] = encoding
+            TRANSFERS[name] = dict(encoding=encoding, bytes=meta.get('bytes'),
+                                   size=os.path.getsize(part),
+                                   seconds=time.perf_counter() - start)
+            os.replace(part, path)
+        except BaseException:
+            if os.path.exists(part):
+                os.remove(part)
+            raise
+
+        with open(meta_path + '.part', 'w') as f:
+            json.dump(meta, f)
+        os.replace(meta_path + '.part', meta_path)
+        return path, True
+
+
+# one lock per cached file, made on first use
+_download_locks = {}
+_download_locks_lock = threading.Lock()
+
+
+def _download_lock(path):
+    with _download_locks_lock:
+        return _download_locks.setdefault(path, threading.Lock())
+
+
+def fetch_snapshot(name, columns=None, cache_dir=CACHE_DIR):
+    ''' downloads a published snapshot into the local cache (unless the
+        cached copy is current) then reads it '''
+    path, changed = download(name, cache_dir)
+    return read_snapshot(path, columns)
@@ -0,0 +1,342 @@
+# for data managaement
+import io
+import os
+import gzip
+import zlib
+import time
+import shutil
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+# for fetching published files
+import httpcache
+
+
+# where ETL outputs are published and the app reads them from:
+# 's3' (the public bucket), 'local' (a directory) or 'memory'
+STORAGE = os.environ.get('STORAGE', 's3')
+STORAGE_DIR = os.environ.get('STORAGE_DIR', 'storage')
+
+# published files can also be stored compressed, under the file name plus
+# one of these suffixes. zstd needs the zstandard package
+ENCODINGS = {'gzip': '.gz', 'zstd': '.zst'}
+
+BUCKET = 'covid-19-app-data'
+BUCKET_URL = 'https://covid-19-app-data.s3.eu-west-2.amazonaws.com/'
+# set to point the S3 backend at a stand-in such as moto or minio
+ENDPOINT_URL = os.environ.get('S3_ENDPOINT_URL')
+
+# streamed uploads are sent in parts of this size (S3 needs at least 5MB
+# for all but the last part), this many at once, each tried a few times
+PART_SIZE = int(os.environ.get('UPLOAD_PART_MB', 8)) * 1024 * 1024
+UPLOAD_WORKERS = int(os.environ.get('UPLOAD_WORKERS', 4))
+UPLOAD_RETRIES = 3
+
+
+def compress(path, encoding):
+    ''' writes a compressed copy of path next to it, streaming, and returns
+        its path. gzip copies carry no timestamp, so the same data always
+        compresses to the same bytes '''
+    target = path + ENCODINGS[encoding]
+    with open(path, 'rb') as src, open(target, 'wb') as dst:
+        if encoding == 'gzip':
+            with gzip.GzipFile(fileobj=dst, mode='wb', mtime=0) as out:
+                shutil.copyfileobj(src, out, 1 << 20)
+        else:
+            import zstandard
+            zstandard.ZstdCompressor(level=10).copy_stream(src, dst)
+    return target
+
+
+def decompressor(encoding):
+    ''' returns an object whose decompress method takes the compressed
+        stream chunk by chunk, or None for uncompressed files '''
+    if encoding == 'gzip':
+        return zlib.decompressobj(16 + zlib.MAX_WBITS)
+    if encoding == 'zstd':
+        import zstandard
+        return zstandard.ZstdDecompressor().decompressobj()
+    return None
+
+
+def write_stream(chunks, dest, encoding=None):
+    ''' writes chunks to dest, decompressing them on the way if encoding is
+        given. Returns the number of bytes read, before decompression '''
+    decoder = decompressor(encoding)
+    size = 0
+    with open(dest, 'wb') as f:
+        for chunk in chunks:
+            size += len(chunk)
+            f.write(decoder.decompress(chunk) if decoder else chunk)
+        if decoder and hasattr(decoder, 'flush'):
+            f.write(decoder.flush())
+    return size
+
+
+def read_chunks(path, chunk_size=1 << 20):
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(chunk_size), b''):
+            yield chunk
+
+
+class S3Upload(io.RawIOBase):
+    ''' a writable file that streams into an S3 multipart upload. Written
+        bytes are cut into parts which are uploaded in a thread pool while
+        the caller keeps writing, at most two parts per worker are held in
+        memory. close completes the upload, abort throws it away '''
+
+    def __init__(self, client, bucket, key, extra, part_size=PART_SIZE,
+                 workers=UPLOAD_WORKERS, retries=UPLOAD_RETRIES):
+        self.client = client
+        self.bucket = bucket
+        self.key = key
+        self.part_size = part_size
+        self.retries = retries
+        self.upload_id = client.create_multipart_upload(
+            Bucket=bucket, Key=key, **extra)['UploadId']
+        self.buffer = bytearray()
+        self.futures = []
+        self.pool = ThreadPoolExecutor(max_workers=workers)
+        self.slots = threading.BoundedSemaphore(2 * workers)
+
+    def writable(self):
+        return True
+
+    def write(self, b):
+        self.buffer += b
+        while len(self.buffer) >= self.part_size:
+            self._send(bytes(self.buffer[:self.part_size]))
+            del self.buffer[:self.part_size]
+        return len(b)
+
+    def _send(self, body):
+        number = len(self.futures) + 1
+        self.slots.acquire()
+        future = self.pool.submit(self._put, number, body)
+        future.add_done_callback(lambda f: self.slots.release())
+        self.futures.append(future)
+
+    def _put(self, number, body):
+        for attempt in range(self.retries):
+            try:
+                res = self.client.upload_part(
+                    Bucket=self.bucket, Key=self.key, UploadId=self.upload_id,
+                    PartNumber=number, Body=body)
+                return dict(PartNumber=number, ETag=res['ETag'])
+            except Exception:
+                if attempt == self.retries - 1:
+                    raise
+                time.sleep(0.5 * 2 ** attempt)
+
+    def close(self):
+        if self.closed:
+            return
+        try:
+            if self.buffer or not self.futures:
+                self._send(bytes(self.buffer))
+            parts = [f.result() for f in self.futures]
+            self.client.complete_multipart_upload(
+                Bucket=self.bucket, Key=self.key, UploadId=self.upload_id,
+                MultipartUpload={'Parts': parts})
+        except Exception:
+            self.abort()
+            raise
+        self.pool.shutdown()
+        super().close()
+
+    def abort(self):
+        for f in self.futures:
+            f.cancel()
+        self.pool.shutdown()
+        self.client.abort_multipart_upload(
+            Bucket=self.bucket, Key=self.key, UploadId=self.upload_id)
+        super().close()
+
+
+class S3Storage:
+    ''' the public S3 bucket. Uploads go through one boto3 client, made on
+        first use, and reads are conditional GETs on the public url over
+        one session '''
+
+    def __init__(self, bucket=BUCKET, url=BUCKET_URL, access_key=None,
+                 secret_key=None, endpoint_url=ENDPOINT_URL):
+        self.bucket = bucket
+        # a stand-in serves the bucket under its endpoint
+        self.url = '{}/{}/'.format(endpoint_url.rstrip('/'), bucket) if endpoint_url else url
+        self.endpoint_url = endpoint_url
+        self.access_key = access_key
+        self.secret_key = secret_key
+        self._client = None
+        self._session = httpcache.session()
+
+    @property
+    def client(self):
+        # keys given to get_storage are read now, as the backend may have
+        # been made (to read) before they were given
+        if self._client is None:
+            import boto3
+            self._client = boto3.client(
+                "s3",
+                aws_access_key_id=self.access_key or _credentials.get('access_key'),
+                aws_secret_access_key=self.secret_key or _credentials.get('secret_key'),
+                endpoint_url=self.endpoint_url
+            )
+        return self._client
+
+    def open_upload(self, key, encoding=None):
+        ''' returns a writable file that streams into key, see S3Upload '''
+        extra = {'ACL': 'public-read'}
+        if encoding:
+            extra.update(ContentEncoding=encoding,
+                         ContentType='application/octet-stream')
+        return S3Upload(self.client, self.bucket, key, extra)
+
+    def upload(self, path, key=None, encoding=None):
+        ''' uploads a local file, publicly readable, under key (or its path)
+            a compressed file is tagged with its Content-Encoding '''
+        extra = {'ACL': 'public-read'}
+        if encoding:
+            extra.update(ContentEncoding=encoding,
+                         ContentType='application/octet-stream')
+        self.client.upload_file(
+            Bucket=self.bucket,
+            Filename=path,
+            Key=key or path,
+            ExtraArgs=extra
+        )
+
+    def download(self, key, dest, meta=None, encoding=None):
+        ''' writes key to dest, decompressing it if it is stored with an
+            encoding, unless it matches meta from an earlier download
+            Returns the new meta, or None if it had not changed '''
+        headers = {}
+        if meta and meta.get('etag'):
+            headers['If-None-Match'] = meta['etag']
+        if meta and meta.get('last_modified'):
+            headers['If-Modified-Since'] = meta['last_modified']
+
+        with self._session.get(self.url + key, headers=headers, stream=True) as res:
+            if res.status_code == 304:
+                return None
+            res.raise_for_status()
+            # the body is read as stored, and decompressed here as it
+            # arrives, so the bytes counted are the bytes transferred
+            size = write_stream(res.raw.stream(1 << 20, decode_content=False),
+                                dest, encoding)
+            return dict(etag=res.headers.get('ETag'),
+                        last_modified=res.headers.get('Last-Modified'),
+                        bytes=size)
+
+
+class LocalUpload(io.FileIO):
+    ''' a file written next to its target and moved there on close '''
+
+    def __init__(self, target):
+        os.makedirs(os.path.dirname(os.path.abspath(target)), exist_ok=True)
+        self.target = target
+        super().__init__(target + '.part', 'wb')
+
+    def close(self):
+        if not self.closed:
+            super().close()
+            os.replace(self.target + '.part', self.target)
+
+    def abort(self):
+        super().close()
+        os.remove(self.target + '.part')
+
+
+class LocalStorage:
+    ''' a local directory laid out like the bucket, for running the pipeline
+        and the dashboard without the network '''
+
+    def __init__(self, root=STORAGE_DIR, **kwargs):
+        self.root = root
+
+    def upload(self, path, key=None, encoding=None):
+        target = os.path.join(self.root, key or path)
+        os.makedirs(os.path.dirname(os.path.abspath(target)), exist_ok=True)
+        shutil.copyfile(path, target + '.part')
+        os.replace(target + '.part', target)
+
+    def open_upload(self, key, encoding=None):
+        return LocalUpload(os.path.join(self.root, key))
+
+    def download(self, key, dest, meta=None, encoding=None):
+        source = os.path.join(self.root, key)
+        stat = os.stat(source)
+        new_meta = dict(etag='{}-{}'.format(stat.st_mtime_ns, stat.st_size))
+        if meta and meta.get('etag') == new_meta['etag']:
+            return None
+        new_meta['bytes'] = write_stream(read_chunks(source), dest, encoding)
+        return new_meta
+
+
+class MemoryUpload(io.BytesIO):
+    ''' collects written bytes and stores them on close '''
+
+    def __init__(self, storage, key):
+        super().__init__()
+        self.storage = storage
+        self.key = key
+
+    def close(self):
+        if not self.closed:
+            self.storage.store(self.key, self.getvalue())
+            super().close()
+
+    def abort(self):
+        super().close()
+
+
+class MemoryStorage:
+    ''' keeps published files in a dict, for tests and benchmarks '''
+
+    def __init__(self, **kwargs):
+        self.files = {}
+        self.versions = {}
+
+    def upload(self, path, key=None, encoding=None):
+        with open(path, 'rb') as f:
+            self.store(key or path, f.read())
+
+    def store(self, key, content):
+        self.files[key] = content
+        self.versions[key] = self.versions.get(key, 0) + 1
+
+    def open_upload(self, key, encoding=None):
+        return MemoryUpload(self, key)
+
+    def download(self, key, dest, meta=None, encoding=None):
+        new_meta = dict(etag=str(self.versions[key]))
+        if meta and meta.get('etag') == new_meta['etag']:
+            return None
+        new_meta['bytes'] = write_stream([self.files[key]], dest, encoding)
+        return new_meta
+
+
+BACKENDS = {'s3': S3Storage, 'local': LocalStorage, 'memory': MemoryStorage}
+
+_storage = None
+
+# the S3 keys, kept apart from the backend and read when it makes its upload
+# client
+_credentials = {}
+
+
+def get_storage(access_key=None, secret_key=None):
+    ''' returns the configured backend, made once and then reused so its
+        connections are too. The S3 keys can be given on any call, e.g. by
+        an ETL script after the app's loaders have made the backend, but
+        not once an upload client has been made with other keys '''
+    global _storage
+    given = {k: v for k, v in [('access_key', access_key), ('secret_key', secret_key)]
+             if v is not None}
+    if given and dict(_credentials, **given) != _credentials:
+        if getattr(_storage, '_client', None) is not None:
+            raise ValueError('S3 keys were given after the upload client was made')
+        _credentials.update(given)
+
+    if _storage is None:
+        _storage = BACKENDS[STORAGE]()
+    return _storage
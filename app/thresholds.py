@@ -0,0 +1,71 @@
+# for data managaement
+import numpy as np
+
+
+def build_crossing_index(data, country_index, var):
+    ''' precomputes what is needed to find, for every country at once, the
+        first row where var goes above a threshold
+
+        within each country the running maximum of var is monotonic, and the
+        first row above a threshold is the same for var and its running
+        maximum. Each country's running maximum is lifted by its block number
+        times the range of the data, which makes the whole array sorted so
+        one searchsorted call answers every country '''
+    names = list(country_index.keys())
+    starts = np.array([country_index[x][0] for x in names], dtype=np.int64)
+    stops = np.array([country_index[x][1] for x in names], dtype=np.int64)
+    return crossing_index(names, starts, stops, data[var].to_numpy(dtype=float))
+
+
+def build_matrix_crossing_index(matrices, metric):
+    ''' the same index, made from a metric's dates x countries array (see
+        matrix.py) rather than long data. The array's reported (non NaN)
+        values are taken country by country, which gives each country's
+        series as one block '''
+    values = np.asarray(matrices['values'][metric], dtype=float).T
+    reported = ~np.isnan(values)
+    stops = np.cumsum(reported.sum(axis=1))
+    starts = stops - reported.sum(axis=1)
+    return crossing_index(list(matrices['countries']), starts.astype(np.int64),
+                          stops.astype(np.int64), values[reported])
+
+
+def crossing_index(names, starts, stops, values):
+    ''' builds the index from each country's [start, stop) block of values '''
+    lo = np.nanmin(values) if np.isfinite(values).any() else 0.
+    filled = np.where(np.isnan(values), lo, values) - lo
+
+    # block number of every row, then the running maximum within each block
+    block = np.repeat(np.arange(len(names)), stops - starts)
+    span = filled.max() + 1 if len(filled) else 1.
+    keys = np.maximum.accumulate(filled + block * span)
+
+    return dict(names=names, starts=starts, stops=stops, values=values,
+                keys=keys, lo=lo, span=span)
+
+
+def first_crossings(crossing, threshold):
+    ''' returns the row (counted from the start of each country's block) at
+        which var first goes above threshold, or -1 where it never does '''
+    blocks = np.arange(len(crossing['names']))
+    targets = (threshold - crossing['lo']) + blocks * crossing['span']
+    first = np.searchsorted(crossing['keys'], targets, side='right')
+
+    # the first row above target must still belong to the country
+    first = np.where(first < crossing['stops'], first - crossing['starts'], -1)
+
+    # thresholds below the data's minimum are crossed on the first row
+    return np.where(threshold < crossing['lo'], 0, first)
+
+
+def aligned_series(crossing, threshold):
+    ''' yields (country, start, values) with each country's values shifted so
+        the first row above threshold is at position 0. Countries that never
+        get there are given an empty series '''
+    firsts = first_crossings(crossing, threshold)
+    for name, start, stop, first in zip(crossing['names'], crossing['starts'],
+                                        crossing['stops'], firsts):
+        if first < 0:
+            yield name, start, crossing['values'][0:0]
+        else:
+            yield name, start, crossing['values'][start + first:stop]